@@ -1,18 +1,40 @@
-import tkinter as tk
-from controllers.document_controller import DocumentController
-from controllers.search_controller import SearchController
-from models.database import Database
-from models.nlp_processor import NLPProcessor
-from views.main_view import MainView
+import os
+import sys
+import time
+
+
+def run_gui(started_at):
+    import tkinter as tk
+    from controllers.document_controller import DocumentController
+    from controllers.search_controller import SearchController
+    from models.database import Database
+    from models.nlp_processor import NLPProcessor
+    from views.main_view import MainView
+    from config import Config
 
-def main():
     root = tk.Tk()
     db = Database()
     nlp = NLPProcessor()
-    doc_controller = DocumentController(db, nlp, update_callback=lambda: MainView.update_document_list())
-    search_controller = SearchController(db)
+    index = None
+    if os.path.isdir(Config.INDEX_DIR):
+        # Инвертированный индекс открывается через mmap, только если он был построен
+        from models.inverted_index import InvertedIndex
+        index = InvertedIndex(db)
+    doc_controller = DocumentController(db, nlp, update_callback=lambda: MainView.update_document_list(), index=index)
+    search_controller = SearchController(db, index)
     MainView(root, doc_controller, search_controller)
+    # Модели natasha грузятся в фоне: окно и поиск доступны сразу
+    nlp.preload()
+    root.after_idle(lambda: print(f"Время запуска: {(time.perf_counter() - started_at) * 1000:.0f} мс"))
     root.mainloop()
 
+def main():
+    started_at = time.perf_counter()
+    # С аргументами — консольный режим (без tkinter), иначе — графический интерфейс
+    if len(sys.argv) > 1:
+        from cli import run_cli
+        sys.exit(run_cli(sys.argv[1:]))
+    run_gui(started_at)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
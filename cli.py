@@ -0,0 +1,483 @@
+"""
+Консольный режим без графического интерфейса (tkinter, matplotlib и scipy
+здесь не импортируются):
+
+    python . ingest <файлы или каталоги> [--workers N]
+    python . search <запрос> [--type lemma|form] [--partial] [--pos NOUN] [--filter Case=Gen] [--occurrences] [--explain]
+    python . concordance <словоформа> [--left 5] [--right 5] [--limit 200] [--offset 0]
+    python . pattern "<шаблон>" [--all] [--page-size 200] [--explain]
+    python . freq [--kind lemma|token] [--doc ID] [--limit 50]
+    python . rebuild-stats         — пересчитать частотные таблицы и статистику поиска
+    python . export <файл.xml> [--doc ID]
+    python . import <файл.xml>
+    python . index                 — построить инвертированный индекс
+    python . conllu-export <файл.conllu> [--doc ID]
+    python . conllu-import <файлы.conllu> [--workers N] [--chunk-tokens N] [--drop-indexes]
+    python . snapshot-export <каталог>
+    python . snapshot-import <каталог> [--chunk-tokens N] [--drop-indexes]
+"""
+import argparse
+import os
+import queue
+import statistics
+import time
+from config import Config
+
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf', '.docx')
+SEARCH_TYPES = {'lemma': 'Лемма', 'form': 'Словоформа'}
+
+
+def _collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(dir_path, name) for name in sorted(names)
+                    if name.endswith(SUPPORTED_EXTENSIONS)
+                )
+        elif path.endswith(SUPPORTED_EXTENSIONS):
+            files.append(path)
+    return files
+
+
+def _timed(func, repeat):
+    """Выполняет func repeat раз, возвращает последний результат и времена в мс."""
+    timings = []
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+
+def _print_latency(timings):
+    print(
+        f"Задержка: мин {min(timings):.1f} мс, медиана {statistics.median(timings):.1f} мс, "
+        f"макс {max(timings):.1f} мс ({len(timings)} запусков)"
+    )
+
+
+def _search_controller(db, args):
+    from controllers.search_controller import SearchController
+    from models.query_cache import QueryCache
+
+    # --no-cache: каждый повтор выполняет запрос заново
+    return SearchController(db, _open_index(db), QueryCache(0) if args.no_cache else None)
+
+
+def _print_query_cache(controller):
+    cache = controller.cache_stats()
+    print(
+        f"Кэш запросов: попаданий {cache['hits']}, промахов {cache['misses']} "
+        f"({cache['hit_ratio']:.0%}), записей {cache['entries']}"
+    )
+
+
+def _drain(progress_queue):
+    while True:
+        try:
+            msg_type, msg = progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        print(f"[{msg_type}] {msg}")
+
+
+def _open_index(db):
+    """Инвертированный индекс, если он построен (numpy загружается только тогда)."""
+    if not os.path.isdir(Config.INDEX_DIR):
+        return None
+    from models.inverted_index import InvertedIndex
+    index = InvertedIndex(db)
+    if not index.available:
+        print("Инвертированный индекс устарел, используется SQL (перестройте: index)")
+    return index
+
+
+def cmd_ingest(args, db):
+    from controllers.document_controller import DocumentController
+    from models.nlp_processor import NLPProcessor
+
+    files = _collect_files(args.paths)
+    if not files:
+        print("Нет файлов для загрузки")
+        return 1
+    documents = [
+        (path, os.path.basename(path), args.author, args.date, args.genre)
+        for path in files
+    ]
+    controller = DocumentController(db, NLPProcessor(), index=_open_index(db))
+    start = time.perf_counter()
+    stats = controller.add_documents(documents, workers=args.workers, drop_indexes=args.drop_indexes)
+    elapsed = time.perf_counter() - start
+    _drain(controller.progress_queue)
+
+    tokens = sum(s['tokens'] for s in stats)
+    pages = sum(s['pages'] for s in stats)
+    print(
+        f"Итого: {len(stats)}/{len(files)} документов, {pages} стр., {tokens} токенов "
+        f"за {elapsed:.2f} с ({tokens / elapsed:.0f} ток/с, {len(stats) / elapsed:.2f} док/с)"
+    )
+    cache = controller.cache.stats()
+    print(
+        f"Кэш разбора: попаданий {cache['hits']}, промахов {cache['misses']} "
+        f"({cache['hit_ratio']:.0%}), записей {cache['entries']}, {cache['bytes'] / 2**20:.1f} МБ"
+    )
+    for name, info in controller.nlp_cache_stats().items():
+        print(
+            f"Кэш {name}: попаданий {info['hits']}, промахов {info['misses']} "
+            f"({info['hit_ratio']:.0%})"
+        )
+    return 0 if len(stats) == len(files) else 1
+
+
+def _parse_filters(items):
+    filters = {}
+    for item in items or []:
+        feature, _, value = item.partition('=')
+        if not value:
+            raise SystemExit(f"Неверный фильтр: {item} (ожидается Признак=Значение)")
+        filters[feature] = value
+    return filters
+
+
+def cmd_search(args, db):
+    controller = _search_controller(db, args)
+    filters = _parse_filters(args.filter)
+    if args.pos:
+        filters['pos'] = args.pos
+    search_type = SEARCH_TYPES[args.type]
+    if args.explain:
+        for line in controller.explain(search_type, args.query, filters, args.partial, page_size=args.page_size):
+            print(line)
+        return 0
+    if args.occurrences:
+        return _search_occurrences(controller, search_type, args, filters)
+    rows, timings = _timed(
+        lambda: controller.search(
+            search_type, args.query, dict(filters),
+            partial_match=args.partial
+        ),
+        args.repeat
+    )
+    for token, lemma, pos, title, count in rows:
+        print(f"{token}\t{lemma}\t{pos}\t{title}\t{count}")
+    print(f"Найдено строк: {len(rows)}")
+    _print_latency(timings)
+    _print_query_cache(controller)
+    return 0
+
+
+def _search_occurrences(controller, search_type, args, filters):
+    """Постраничный вывод вхождений (курсор по документу, предложению и позиции)."""
+    after = None
+    total = 0
+    timings = []
+    while True:
+        start = time.perf_counter()
+        rows, after = controller.search_page(
+            search_type, args.query, filters, args.partial, after, args.page_size
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+        for token, lemma, pos, title, sentence, *_ in rows:
+            print(f"{token}\t{lemma}\t{pos}\t{title}\t{sentence}")
+        total += len(rows)
+        if after is None:
+            break
+    print(f"Вхождений: {total}, страниц: {len(timings)}")
+    _print_latency(timings)
+    return 0
+
+
+def cmd_pattern(args, db):
+    controller = _search_controller(db, args)
+    try:
+        if args.explain:
+            for line in controller.explain_pattern(args.pattern, args.page_size):
+                print(line)
+            return 0
+        after = None
+        shown = 0
+        timings = []
+        while True:
+            start = time.perf_counter()
+            rows, after = controller.search_pattern(args.pattern, after, args.page_size)
+            timings.append((time.perf_counter() - start) * 1000)
+            for words, lemmas, tags, title, sentence, *_ in rows:
+                print(f"{words}\t{tags}\t{title}\t{sentence}")
+            shown += len(rows)
+            if after is None or not args.all:
+                break
+        total = controller.count_pattern(args.pattern)
+    except ValueError as e:
+        print(e)
+        return 2
+    print(f"Совпадений: {total}, показано: {shown}")
+    _print_latency(timings)
+    return 0
+
+
+def cmd_concordance(args, db):
+    controller = _search_controller(db, args)
+    lines, timings = _timed(
+        lambda: controller.get_concordance(args.word, args.left, args.right, args.limit or None, args.offset),
+        args.repeat
+    )
+    for line in lines:
+        print(line)
+    print(f"Вхождений: {len(lines)}")
+    _print_latency(timings)
+    _print_query_cache(controller)
+    return 0
+
+
+def cmd_frequencies(args, db):
+    controller = _search_controller(db, args)
+    rows, timings = _timed(
+        lambda: controller.frequencies(args.kind, args.doc, args.limit),
+        args.repeat
+    )
+    for row in rows:
+        print("\t".join(str(value) for value in row))
+    _print_latency(timings)
+    return 0
+
+
+def cmd_rebuild_stats(args, db):
+    start = time.perf_counter()
+    with db.lock:
+        db.rebuild_frequencies()
+        db.rebuild_statistics()
+    db.bump_version()
+    print(f"Частотные таблицы и статистика пересчитаны за {time.perf_counter() - start:.2f} с")
+    return 0
+
+
+def cmd_export(args, db):
+    from utils.xml_utils import export_database_to_xml, export_document_to_xml
+
+    def progress(rows):
+        print(f"Выгружено токенов: {rows}", end='\r', flush=True)
+
+    start = time.perf_counter()
+    if args.doc is not None:
+        rows = export_document_to_xml(db, args.doc, args.path, progress)
+    else:
+        rows = export_database_to_xml(db, args.path, progress)
+    print(f"Экспорт {rows} токенов в {args.path} за {time.perf_counter() - start:.2f} с")
+    return 0
+
+
+def cmd_import(args, db):
+    from utils.xml_utils import import_database_from_xml
+
+    def progress(tokens):
+        print(f"Загружено токенов: {tokens}", end='\r', flush=True)
+
+    stats = import_database_from_xml(
+        db, args.path, args.chunk_tokens, progress, drop_indexes=args.drop_indexes,
+        index=_open_index(db)
+    )
+    seconds = stats['seconds']
+    print(
+        f"Импорт из {args.path} за {seconds:.2f} с: документов {stats['documents']}, "
+        f"пропущено {stats['skipped']}, токенов {stats['tokens']} "
+        f"({stats['tokens'] / seconds if seconds else 0.0:.0f} ток/с)"
+    )
+    return 0
+
+
+def cmd_conllu_export(args, db):
+    from utils.conllu_utils import export_database_to_conllu, export_document_to_conllu
+
+    def progress(rows):
+        print(f"Выгружено токенов: {rows}", end='\r', flush=True)
+
+    start = time.perf_counter()
+    if args.doc is not None:
+        rows = export_document_to_conllu(db, args.doc, args.path, progress)
+    else:
+        rows = export_database_to_conllu(db, args.path, progress)
+    print(f"Экспорт {rows} токенов в {args.path} за {time.perf_counter() - start:.2f} с")
+    return 0
+
+
+def cmd_conllu_import(args, db):
+    from utils.conllu_utils import import_conllu
+
+    def progress(tokens):
+        print(f"Загружено токенов: {tokens}", end='\r', flush=True)
+
+    try:
+        stats = import_conllu(
+            db, args.paths, args.workers, args.chunk_tokens, progress,
+            drop_indexes=args.drop_indexes, index=_open_index(db)
+        )
+    except ValueError as e:
+        print(e)
+        return 2
+    seconds = stats['seconds']
+    print(
+        f"Импорт CoNLL-U за {seconds:.2f} с: документов {stats['documents']}, "
+        f"пропущено {stats['skipped']}, токенов {stats['tokens']} "
+        f"({stats['tokens'] / seconds if seconds else 0.0:.0f} ток/с)"
+    )
+    return 0
+
+
+def cmd_snapshot_export(args, db):
+    from utils.snapshot_utils import export_snapshot
+
+    def progress(rows):
+        print(f"Выгружено токенов: {rows}", end='\r', flush=True)
+
+    start = time.perf_counter()
+    rows = export_snapshot(db, args.path, progress)
+    print(f"Снимок {rows} токенов в {args.path} за {time.perf_counter() - start:.2f} с")
+    return 0
+
+
+def cmd_snapshot_import(args, db):
+    from utils.snapshot_utils import import_snapshot
+
+    def progress(tokens):
+        print(f"Загружено токенов: {tokens}", end='\r', flush=True)
+
+    try:
+        stats = import_snapshot(
+            db, args.path, args.chunk_tokens, progress,
+            drop_indexes=args.drop_indexes, index=_open_index(db)
+        )
+    except ValueError as e:
+        print(e)
+        return 2
+    seconds = stats['seconds']
+    print(
+        f"Импорт снимка {args.path} за {seconds:.2f} с: документов {stats['documents']}, "
+        f"пропущено {stats['skipped']}, токенов {stats['tokens']} "
+        f"({stats['tokens'] / seconds if seconds else 0.0:.0f} ток/с)"
+    )
+    return 0
+
+
+def cmd_index(args, db):
+    from models.inverted_index import InvertedIndex
+
+    start = time.perf_counter()
+    InvertedIndex(db).build()
+    print(f"Индекс построен в {Config.INDEX_DIR} за {time.perf_counter() - start:.2f} с")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='corpus', description="Корпусный менеджер (консольный режим)")
+    parser.add_argument('--db', default=Config.DB_PATH, help="путь к базе SQLite")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('ingest', help="добавить документы")
+    p.add_argument('paths', nargs='+', help="файлы .txt/.pdf/.docx или каталоги")
+    p.add_argument('--workers', type=int, default=None, help="число процессов разбора")
+    p.add_argument('--author', default='')
+    p.add_argument('--date', default='')
+    p.add_argument('--genre', default='')
+    p.add_argument('--drop-indexes', action='store_true',
+                   help="перестроить индексы tokens после загрузки вместо обновления по ходу")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser('search', help="поиск по лемме или словоформе")
+    p.add_argument('query')
+    p.add_argument('--type', choices=SEARCH_TYPES, default='lemma')
+    p.add_argument('--partial', action='store_true', help="частичное совпадение")
+    p.add_argument('--pos', help="часть речи (NOUN, VERB, ...)")
+    p.add_argument('--filter', action='append', help="грамматический фильтр, например Case=Gen")
+    p.add_argument('--occurrences', action='store_true',
+                   help="вывести все вхождения постранично вместо сводки по документам")
+    p.add_argument('--page-size', type=int, default=Config.SEARCH_PAGE_SIZE)
+    p.add_argument('--explain', action='store_true',
+                   help="показать план запроса: оценки и фактическое число строк")
+    p.add_argument('--repeat', type=int, default=1, help="число повторов для замера задержки")
+    p.add_argument('--no-cache', action='store_true', help="не использовать кэш результатов")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser('pattern', help="поиск по шаблону из нескольких токенов")
+    p.add_argument('pattern', help="например: 'ADJ[Case=Gen] + NOUN[Case=Gen]' "
+                                   "или \"lemma 'идти' within 3 tokens of NOUN[Animacy=Anim]\"")
+    p.add_argument('--page-size', type=int, default=Config.SEARCH_PAGE_SIZE)
+    p.add_argument('--all', action='store_true', help="вывести все совпадения, а не первую страницу")
+    p.add_argument('--explain', action='store_true', help="показать план: ведущий элемент и оценки")
+    p.add_argument('--no-cache', action='store_true', help="не использовать кэш результатов")
+    p.set_defaults(func=cmd_pattern)
+
+    p = sub.add_parser('concordance', help="конкорданс словоформы")
+    p.add_argument('word')
+    p.add_argument('--left', type=int, default=Config.CONTEXT_LEFT)
+    p.add_argument('--right', type=int, default=Config.CONTEXT_RIGHT)
+    p.add_argument('--limit', type=int, default=Config.CONCORDANCE_PAGE_SIZE,
+                   help="вхождений на страницу (0 — все)")
+    p.add_argument('--offset', type=int, default=0, help="пропустить первые N вхождений")
+    p.add_argument('--repeat', type=int, default=1, help="число повторов для замера задержки")
+    p.add_argument('--no-cache', action='store_true', help="не использовать кэш результатов")
+    p.set_defaults(func=cmd_concordance)
+
+    p = sub.add_parser('freq', help="частотный список лемм или словоформ")
+    p.add_argument('--kind', choices=['lemma', 'token'], default='lemma')
+    p.add_argument('--doc', type=int, default=None, help="id документа (по умолчанию весь корпус)")
+    p.add_argument('--limit', type=int, default=50)
+    p.add_argument('--repeat', type=int, default=1, help="число повторов для замера задержки")
+    p.add_argument('--no-cache', action='store_true', help="не использовать кэш результатов")
+    p.set_defaults(func=cmd_frequencies)
+
+    p = sub.add_parser('rebuild-stats', help="пересчитать частотные таблицы и статистику поиска")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = sub.add_parser('export', help="экспорт в XML")
+    p.add_argument('path')
+    p.add_argument('--doc', type=int, default=None, help="id документа (по умолчанию вся база)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('import', help="импорт из XML")
+    p.add_argument('path')
+    p.add_argument('--chunk-tokens', type=int, default=None,
+                   help=f"токенов в одной транзакции (по умолчанию {Config.IMPORT_CHUNK_TOKENS})")
+    p.add_argument('--drop-indexes', action='store_true',
+                   help="перестроить индексы tokens после импорта вместо обновления по ходу")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser('conllu-export', help="экспорт в CoNLL-U")
+    p.add_argument('path')
+    p.add_argument('--doc', type=int, default=None, help="id документа (по умолчанию вся база)")
+    p.set_defaults(func=cmd_conllu_export)
+
+    p = sub.add_parser('conllu-import', help="импорт размеченного корпуса из CoNLL-U (без разбора natasha)")
+    p.add_argument('paths', nargs='+', help="файлы .conllu")
+    p.add_argument('--workers', type=int, default=None,
+                   help=f"процессов разбора (по умолчанию {Config.CONLLU_WORKERS})")
+    p.add_argument('--chunk-tokens', type=int, default=None,
+                   help=f"токенов в одном фрагменте и транзакции (по умолчанию {Config.IMPORT_CHUNK_TOKENS})")
+    p.add_argument('--drop-indexes', action='store_true',
+                   help="перестроить индексы tokens после импорта вместо обновления по ходу")
+    p.set_defaults(func=cmd_conllu_import)
+
+    p = sub.add_parser('snapshot-export', help="выгрузить колоночный снимок корпуса (каталог .npy)")
+    p.add_argument('path')
+    p.set_defaults(func=cmd_snapshot_export)
+
+    p = sub.add_parser('snapshot-import', help="загрузить колоночный снимок корпуса")
+    p.add_argument('path')
+    p.add_argument('--chunk-tokens', type=int, default=None,
+                   help=f"токенов в одной транзакции (по умолчанию {Config.IMPORT_CHUNK_TOKENS})")
+    p.add_argument('--drop-indexes', action='store_true',
+                   help="перестроить индексы tokens после импорта вместо обновления по ходу")
+    p.set_defaults(func=cmd_snapshot_import)
+
+    p = sub.add_parser('index', help="построить инвертированный индекс лемм и словоформ")
+    p.set_defaults(func=cmd_index)
+    return parser
+
+
+def run_cli(argv):
+    args = build_parser().parse_args(argv)
+    Config.DB_PATH = args.db
+    from models.database import Database
+    return args.func(args, Database())
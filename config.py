@@ -1,5 +1,40 @@
+import os
+
 class Config:
     DB_PATH = 'corpus.db'
+    # Настройки SQLite: пул читающих соединений и прагмы производительности
+    READ_POOL_SIZE = 4
+    DB_CACHE_KB = 64 * 1024
+    DB_MMAP_BYTES = 256 * 1024 * 1024
+    DB_BUSY_TIMEOUT_MS = 5000
     CONTEXT_LEFT = 5
     CONTEXT_RIGHT = 5
-    PAGE_SIZE = 1000
\ No newline at end of file
+    # Вхождений на одной странице результатов поиска
+    SEARCH_PAGE_SIZE = 200
+    # Через сколько инструкций SQLite проверять, не устарел ли запрос чтения
+    QUERY_PROGRESS_STEPS = 10_000
+    # Записей в кэше результатов поиска, конкорданса и грамматики
+    QUERY_CACHE_SIZE = 256
+    # Вхождений на одной странице конкорданса
+    CONCORDANCE_PAGE_SIZE = 200
+    PAGE_SIZE = 1000
+    # Через сколько выгруженных токенов сообщать о ходе экспорта
+    EXPORT_PROGRESS_ROWS = 100_000
+    # Токенов в одной транзакции потокового импорта XML
+    IMPORT_CHUNK_TOKENS = 50_000
+    # Процессов разбора при импорте CoNLL-U
+    CONLLU_WORKERS = os.cpu_count() or 1
+    # Размер фрагмента текста (символов) для потокового NLP-разбора
+    NLP_CHUNK_SIZE = 100_000
+    # Параллельное извлечение текста из PDF: число процессов и минимальный размер документа
+    PDF_WORKERS = os.cpu_count() or 1
+    PDF_PARALLEL_MIN_PAGES = 50
+    # Кэш результатов разбора по хэшу содержимого файла
+    CACHE_PATH = 'ingest_cache.db'
+    CACHE_MAX_BYTES = 512 * 1024 * 1024
+    CACHE_MAX_DOCUMENT_CHARS = 5_000_000
+    # Размер LRU-кэшей лемматизации и наборов грамматических признаков
+    LEMMA_CACHE_SIZE = 200_000
+    # Инвертированный индекс лемм и словоформ (каталог с файлами .npy)
+    INDEX_DIR = 'corpus_index'
+    INDEX_MAX_SEGMENTS = 32
@@ -1,17 +1,49 @@
 import queue
 from models.database import Database
-from models.nlp_processor import NLPProcessor
+from models.nlp_processor import NLPProcessor, MODEL_VERSION
+from models.ingest_cache import IngestCache
 from models.document import Document
-from utils.file_utils import extract_text
+from models.bulk_writer import BulkWriter
+from config import Config
+from utils.file_utils import extract_text, iter_pages
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from threading import Thread
+import os
 import time 
 
+# NLP-модели рабочего процесса пула: загружаются один раз при старте процесса
+_worker_nlp = None
+
+
+def _init_worker():
+    global _worker_nlp
+    _worker_nlp = NLPProcessor()
+    _worker_nlp.load()
+
+
+def _extract_and_annotate(file_path):
+    """Извлечение текста и морфологический разбор в рабочем процессе."""
+    start_time = time.time()
+    extracted = extract_text(file_path)
+    if not extracted or not extracted['text']:
+        raise ValueError("Не удалось извлечь текст")
+    sentences = _worker_nlp.annotate(extracted['text'])
+    processing_time = time.time() - start_time
+    return extracted, sentences, processing_time, (os.getpid(), _worker_nlp.cache_stats())
+
+
 class DocumentController:
-    def __init__(self, db: Database, nlp: NLPProcessor, update_callback=None):
+    def __init__(self, db: Database, nlp: NLPProcessor, update_callback=None, cache: IngestCache = None, index=None):
         self.db = db
+        # Инвертированный индекс (models.inverted_index.InvertedIndex) или None
+        self.index = index
         self.nlp = nlp
         self.progress_queue = queue.Queue()
         self.update_callback = update_callback
+        self.writer = BulkWriter(db)
+        self.cache = cache or IngestCache(MODEL_VERSION)
+        # Последние снимки статистики кэшей лемматизации рабочих процессов по pid
+        self.worker_nlp_stats = {}
 
     def add_document(self, file_path, title, author, date, genre):
         if self._check_document_exists(title):
@@ -20,31 +52,212 @@ class DocumentController:
 
         Thread(target=self._process_document, args=(file_path, title, author, date, genre)).start()
 
+    def add_documents(self, documents, workers=None, drop_indexes=False):
+        """
+        Пакетное добавление документов.
+
+        documents — список кортежей (file_path, title, author, date, genre).
+        Извлечение текста и разбор выполняются в пуле процессов (по одному
+        набору моделей natasha на процесс), запись в БД — в текущем потоке.
+        drop_indexes — удалить индексы tokens на время загрузки и построить
+        их заново в конце (выгодно для больших пакетов).
+        Возвращает список словарей со статистикой по каждому документу.
+        """
+        workers = workers or os.cpu_count() or 1
+        # Задания (file_path, (title, author, date, genre)): один файл может
+        # быть добавлен несколько раз под разными названиями
+        pending = []
+        seen = set()
+        for file_path, title, author, date, genre in documents:
+            if title in seen or self._check_document_exists(title):
+                self.progress_queue.put(("error", f"Документ с таким названием уже существует: {title}"))
+                continue
+            seen.add(title)
+            pending.append((file_path, (title, author, date, genre)))
+
+        stats = []
+        batch_start = time.time()
+        drop_indexes = drop_indexes and bool(pending)
+        if drop_indexes:
+            with self.db.lock:
+                self.writer.drop_indexes()
+        try:
+            # Уже разобранные файлы берутся из кэша, в пул уходят только новые
+            cache_keys = {}
+            jobs = []
+            for file_path, metadata in pending:
+                try:
+                    if file_path not in cache_keys:
+                        cache_keys[file_path] = self.cache.key_for(file_path)
+                except OSError as e:
+                    self.progress_queue.put(("error", f"{metadata[0]}: {e}"))
+                    continue
+                cached = self.cache.get(cache_keys[file_path])
+                if cached is not None:
+                    self._store_result(metadata, cached, stats, from_cache=True)
+                else:
+                    jobs.append((file_path, metadata))
+            if jobs:
+                self._ingest_pending(jobs, cache_keys, workers, stats)
+        finally:
+            if drop_indexes:
+                with self.db.lock:
+                    self.writer.create_indexes()
+
+        elapsed = time.time() - batch_start
+        if stats:
+            self.progress_queue.put((
+                "info",
+                f"Добавлено документов: {len(stats)} за {elapsed:.2f} с "
+                f"({len(stats) / elapsed:.2f} док/с, {workers} процессов)"
+            ))
+        if stats and self.update_callback:
+            self.update_callback()
+        return stats
+
+    def _ingest_pending(self, jobs, cache_keys, workers, stats):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(_extract_and_annotate, file_path): (file_path, metadata)
+                for file_path, metadata in jobs
+            }
+            for future in as_completed(futures):
+                file_path, metadata = futures[future]
+                title = metadata[0]
+                try:
+                    extracted, sentences, processing_time, (pid, nlp_stats) = future.result()
+                    self.worker_nlp_stats[pid] = nlp_stats
+                    result = (extracted['text'], extracted['page_count'], processing_time, sentences)
+                    self._store_result(metadata, result, stats)
+                except Exception as e:
+                    self.progress_queue.put(("error", f"{title}: {e}"))
+                    continue
+                if len(extracted['text']) <= Config.CACHE_MAX_DOCUMENT_CHARS:
+                    self.cache.put(cache_keys[file_path], *result)
+
+    def _store_result(self, metadata, result, stats, from_cache=False):
+        """Запись разобранного документа и статистика пропускной способности."""
+        title, author, date, genre = metadata
+        text, page_count, processing_time, sentences = result
+        doc_id = None
+        try:
+            with self.db.lock, self.db.conn:
+                doc_id = self._save_document_metadata(
+                    title, author, date, genre,
+                    text, processing_time, page_count
+                )
+                if self.index is not None:
+                    self.index.begin_document(doc_id)
+                token_count = self._save_sentences_and_tokens(sentences, doc_id)
+        except Exception:
+            # Транзакция откатилась: снять отметку записи в индексе
+            if doc_id is not None and self.index is not None:
+                self.index.delete_document(doc_id)
+            raise
+        # Сегмент документа в индексе; слияние сегментов — внутри add_document
+        if self.index is not None:
+            self.index.add_document(doc_id)
+
+        stat = {
+            'title': title,
+            'pages': page_count,
+            'tokens': token_count,
+            'seconds': processing_time,
+            'tokens_per_sec': token_count / processing_time if processing_time else 0.0,
+            'pages_per_sec': page_count / processing_time if processing_time else 0.0,
+        }
+        stats.append(stat)
+        self.progress_queue.put((
+            "success",
+            f"{title}: {stat['tokens']} токенов за {processing_time:.2f} с "
+            f"({stat['tokens_per_sec']:.0f} ток/с, {stat['pages_per_sec']:.1f} стр/с)"
+            + (" [кэш]" if from_cache else "")
+        ))
+
+    def nlp_cache_stats(self):
+        """Суммарная статистика кэшей лемматизации: текущий процесс и рабочие процессы пула."""
+        total = {}
+        for stats in [self.nlp.cache_stats(), *self.worker_nlp_stats.values()]:
+            for name, info in stats.items():
+                agg = total.setdefault(name, {'hits': 0, 'misses': 0})
+                agg['hits'] += info['hits']
+                agg['misses'] += info['misses']
+        for agg in total.values():
+            lookups = agg['hits'] + agg['misses']
+            agg['hit_ratio'] = agg['hits'] / lookups if lookups else 0.0
+        return total
+
     def _check_document_exists(self, title):
-        with self.db.lock, self.db.conn:
-            cur = self.db.conn.cursor()
+        with self.db.reader() as conn:
+            cur = conn.cursor()
             cur.execute("SELECT COUNT(*) FROM documents WHERE title=?", (title,))
             return cur.fetchone()[0] > 0
 
     def _process_document(self, file_path, title, author, date, genre):
-        start_time = time.time() 
+        doc_id = None
+        pages = []
+
+        def iter_document_pages():
+            # Страницы сохраняются для documents.text и page_count,
+            # а разбор начинается, не дожидаясь конца извлечения
+            for page in iter_pages(file_path, Config.PDF_WORKERS):
+                pages.append(page)
+                yield page
+
         try:
-            extracted = extract_text(file_path)
-            if not extracted or not extracted['text']:
-                raise ValueError("Не удалось извлечь текст")
-            doc = self.nlp.process(extracted['text'])
-            processing_time = time.time() - start_time
+            cache_key = self.cache.key_for(file_path)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._store_result((title, author, date, genre), cached, [], from_cache=True)
+                if self.update_callback:
+                    self.update_callback()
+                return
+
             with self.db.lock, self.db.conn:
                 doc_id = self._save_document_metadata(
-                    title, author, date, genre, 
-                    extracted['text'], processing_time, 
-                    extracted['page_count']
+                    title, author, date, genre, '', None, None
+                )
+            if self.index is not None:
+                self.index.begin_document(doc_id)
+            # Извлечение, разбор и запись по фрагментам: в памяти одновременно
+            # находится только один фрагмент текста и его аннотации.
+            # Аннотации документов до CACHE_MAX_DOCUMENT_CHARS символов
+            # дописываются в запись кэша сжатыми, по фрагменту за раз.
+            cache_entry = self.cache.writer(cache_key)
+            processing_time = 0.0
+            token_count = 0
+            chunk_start = time.time()
+            for sentences in self.nlp.annotate_stream(iter_document_pages()):
+                processing_time += time.time() - chunk_start
+                with self.db.lock:
+                    token_count += self._save_sentences_and_tokens(sentences, doc_id)
+                if cache_entry is not None:
+                    if (sum(map(len, pages)) <= Config.CACHE_MAX_DOCUMENT_CHARS
+                            and cache_entry.size <= self.cache.max_bytes):
+                        cache_entry.add(sentences)
+                    else:
+                        cache_entry = None
+                del sentences
+                chunk_start = time.time()
+            processing_time += time.time() - chunk_start
+            text = ''.join(pages)
+            if not text.strip() or not token_count:
+                raise ValueError("Не удалось извлечь текст")
+            with self.db.lock, self.db.conn:
+                self.db.conn.execute(
+                    "UPDATE documents SET text = ?, processing_time = ?, page_count = ? WHERE id = ?",
+                    (text, processing_time, len(pages), doc_id)
                 )
-                self._save_sentences_and_tokens(doc, doc_id)
+            if self.index is not None:
+                self.index.add_document(doc_id)
+            if cache_entry is not None:
+                cache_entry.finish(text, len(pages), processing_time)
             self.progress_queue.put(("success", "Документ успешно добавлен"))
             if self.update_callback:
                self.update_callback()
         except Exception as e:
+            if doc_id is not None:
+                self.delete_document(doc_id)
             self.progress_queue.put(("error", str(e)))
 
     def _save_document_metadata(self, title, author, date, genre, text, processing_time, page_count):
@@ -56,95 +269,16 @@ class DocumentController:
             ''', (title, author, date, genre, text, processing_time, page_count))
             return cur.lastrowid
    
-    def _save_sentences_and_tokens(self, doc, doc_id):
-        # Сохраняем предложения
-        sentences = [(doc_id, sent.text) for sent in doc.sents]
-        with self.db.conn:
-            cur = self.db.conn.cursor()
-            
-            # Вставляем предложения
-            cur.executemany(
-                "INSERT INTO sentences (doc_id, sentence_text) VALUES (?, ?)", 
-                sentences
-            )
-            
-            # Получаем ID вставленных предложений
-            cur.execute("SELECT id FROM sentences WHERE doc_id = ? ORDER BY id", (doc_id,))
-            sent_ids = [row[0] for row in cur.fetchall()]
-            
-            grammar_features = []
-            for sent_idx, sent in enumerate(doc.sents):
-                # Пропускаем если не совпадает количество предложений (защита от коррупции данных)
-                if sent_idx >= len(sent_ids):
-                    continue
-                    
-                sentence_id = sent_ids[sent_idx]
-                
-                for token in sent.tokens:
-                    # Лемматизация
-                    token.lemmatize(self.nlp.morph_vocab)
-                    
-                    # Обработка грамматических признаков
-                    feats = token.feats or {}
-                    feats_str = ""
-                    if isinstance(feats, dict):
-                        feats_str = "|".join([f"{k}={v}" for k, v in feats.items()])
-                    else:
-                        feats_str = str(feats)
-                    
-                    # Сохраняем токен
-                    cur.execute('''
-                        INSERT INTO tokens (
-                            sentence_id, 
-                            token, 
-                            lemma, 
-                            pos, 
-                            start, 
-                            end
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        sentence_id,
-                        token.text,
-                        token.lemma,
-                        token.pos,
-                        token.start,
-                        token.stop
-                    ))
-                    token_id = cur.lastrowid
-                    
-                    # Сохраняем грамматические признаки
-                    if feats_str:
-                        for feat in feats_str.split('|'):
-                            if '=' in feat:
-                                key, val = feat.split('=', 1)
-                                grammar_features.append((
-                                    token_id, 
-                                    key.strip(), 
-                                    val.strip()
-                                ))
-            
-            # Пакетная вставка грамматических признаков
-            if grammar_features:
-                cur.executemany('''
-                    INSERT INTO grammar_features (
-                        token_id, 
-                        feature, 
-                        value
-                    ) VALUES (?, ?, ?)
-                ''', grammar_features)
+    def _save_sentences_and_tokens(self, annotated, doc_id):
+        return self.writer.write(doc_id, annotated)
 
     def delete_document(self, doc_id):
-        with self.db.lock, self.db.conn:
-            cur = self.db.conn.cursor()
-            cur.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
-            cur.execute('DELETE FROM sentences WHERE doc_id = ?', (doc_id,))
-            cur.execute('''
-                DELETE FROM tokens 
-                WHERE sentence_id IN (SELECT id FROM sentences WHERE doc_id = ?)
-            ''', (doc_id,))
+        self.db.delete_document(doc_id)
+        if self.index is not None:
+            self.index.delete_document(doc_id)
 
     def get_document_content(self, doc_id):
-        with self.db.lock, self.db.conn:
-            cur = self.db.conn.cursor()
+        with self.db.reader() as conn:
+            cur = conn.cursor()
             cur.execute('SELECT text FROM documents WHERE id = ?', (doc_id,))
             return cur.fetchone()[0]
\ No newline at end of file
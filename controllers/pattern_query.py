@@ -0,0 +1,297 @@
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Лексемы языка шаблонов
+_LEXEME = re.compile(r"""
+    \s*(?:
+        (?P<lemma>'[^']*')
+      | (?P<word>"[^"]*")
+      | (?P<number>\d+)
+      | (?P<name>[^\W\d]\w*)
+      | (?P<symbol>[+>~\[\]=,*])
+    )""", re.VERBOSE)
+
+
+@dataclass
+class PatternElement:
+    """
+    Токен шаблона: лемма ('идти'), словоформа ("шёл"), часть речи и
+    грамматические признаки ([Case=Gen]); '*' на конце леммы или словоформы —
+    поиск по префиксу. Элемент без условий ('*') — любой токен.
+    """
+    lemma: Optional[str] = None
+    word: Optional[str] = None
+    # признаки в кодах UD, часть речи — под ключом 'pos'
+    features: Dict[str, str] = field(default_factory=dict)
+
+    def __str__(self):
+        features = dict(self.features)
+        if self.lemma is not None:
+            head = f"'{self.lemma}'"
+        elif self.word is not None:
+            head = f'"{self.word}"'
+        else:
+            head = features.pop('pos', '*')
+        if self.lemma is not None and self.word is not None:
+            features['word'] = f'"{self.word}"'
+        feats = ",".join(f"{feat}={val}" for feat, val in features.items())
+        return head + (f"[{feats}]" if feats else "")
+
+
+@dataclass
+class Relation:
+    """
+    Положение элемента относительно предыдущего: ordered — правее него не
+    дальше distance токенов ('+' — вплотную, '>N'), иначе — с любой стороны
+    не дальше distance токенов ('~N', 'within N tokens of').
+    """
+    ordered: bool
+    distance: int = 1
+
+    def position_sql(self, prev, cur, inner):
+        """
+        Условие на позиции токенов prev и cur (псевдонимы) того же предложения.
+        inner — тот из них, что ищется по idx_sentence_position: его позиция
+        выражается через позицию другого, чтобы условие было диапазоном индекса.
+        """
+        outer = cur if inner == prev else prev
+        sign = 1 if inner == cur else -1
+        if self.ordered:
+            low, high = sorted((sign, sign * self.distance))
+            if low == high:
+                return f"{inner}.position = {outer}.position {low:+d}"
+            return f"{inner}.position BETWEEN {outer}.position {low:+d} AND {outer}.position {high:+d}"
+        return (
+            f"{inner}.position BETWEEN {outer}.position - {self.distance} "
+            f"AND {outer}.position + {self.distance} AND {inner}.position != {outer}.position"
+        )
+
+    def width(self):
+        """Число позиций, на которых может стоять элемент."""
+        return self.distance if self.ordered else 2 * self.distance
+
+    def __str__(self):
+        if self.ordered:
+            return "+" if self.distance == 1 else f">{self.distance}"
+        return f"~{self.distance}"
+
+
+@dataclass
+class Pattern:
+    """Цепочка элементов; relations[i] — положение элемента i + 1 относительно i."""
+    elements: List[PatternElement]
+    relations: List[Relation]
+
+    def __str__(self):
+        parts = [str(self.elements[0])]
+        for relation, element in zip(self.relations, self.elements[1:]):
+            parts.extend([str(relation), str(element)])
+        return " ".join(parts)
+
+    def join_sql(self, driver, scan=False):
+        """
+        Источник запроса (FROM ...) с токенами t0..tN элементов.
+
+        Без scan токены соединяются от ведущего элемента driver к концам
+        цепочки: каждый следующий ищется по idx_sentence_position в том же
+        предложении рядом с уже найденным соседом (CROSS JOIN фиксирует
+        порядок). При scan проход идёт по предложениям в порядке
+        (документ, предложение) и токенам t0 по позиции — для частых шаблонов,
+        когда страница заполняется раньше, чем закончились бы вхождения.
+        """
+        last = len(self.elements) - 1
+        if scan:
+            order = list(range(last + 1))
+            sql = [
+                "FROM sentences s",
+                "CROSS JOIN tokens t0 INDEXED BY idx_sentence_position ON t0.sentence_id = s.id",
+            ]
+        else:
+            order = [driver, *range(driver + 1, last + 1), *range(driver - 1, -1, -1)]
+            sql = [f"FROM tokens t{driver}"]
+        for i in order[1:]:
+            # сосед, уже присоединённый раньше: слева для правой части цепочки
+            if i > order[0]:
+                prev, cur, relation = f"t{i - 1}", f"t{i}", self.relations[i - 1]
+            else:
+                prev, cur, relation = f"t{i}", f"t{i + 1}", self.relations[i]
+            inner, other = (cur, prev) if i > order[0] else (prev, cur)
+            sql.append(
+                f"CROSS JOIN tokens t{i} INDEXED BY idx_sentence_position "
+                f"ON t{i}.sentence_id = {other}.sentence_id "
+                f"AND {relation.position_sql(prev, cur, inner)}"
+            )
+        if not scan:
+            sql.append(f"CROSS JOIN sentences s ON s.id = t{driver}.sentence_id")
+        sql.append("CROSS JOIN documents d ON d.id = s.doc_id")
+        return "\n".join(sql)
+
+
+@dataclass
+class PatternPlan:
+    """
+    План поиска по шаблону: планы условий каждого элемента (query_planner.Plan),
+    ведущий элемент (с наименьшей оценкой), оценка числа совпадений и способ
+    выдачи страниц ('sort' или 'scan', как в QueryPlanner.plan).
+    """
+    pattern: Pattern
+    plans: List[Any]
+    driver: int
+    estimate: int
+    strategy: str = 'sort'
+
+    def join_sql(self):
+        return self.pattern.join_sql(self.driver, scan=self.strategy == 'scan')
+
+    def where(self):
+        """Условия элементов: у ведущего — по его индексу, у остальных — фильтры."""
+        where, params = [], []
+        for i, plan in enumerate(self.plans):
+            use_driver = i == self.driver and self.strategy != 'scan'
+            plan_where, plan_params = plan.where(use_driver=use_driver, alias=f't{i}')
+            where.extend(plan_where)
+            params.extend(plan_params)
+        return where, params
+
+
+def plan_pattern(pattern, plans, total, page_size=None):
+    """
+    Ведущий элемент — с наименьшей оценкой числа токенов. Оценка совпадений:
+    вхождения ведущего элемента, умноженные для каждого другого элемента на
+    ожидаемое число его токенов на допустимых позициях рядом с соседом.
+    Проход по предложениям ('scan') выбирается при оценке не меньше
+    sqrt(page_size · N) — по тому же соображению, что и в QueryPlanner.plan.
+    """
+    driver = min(range(len(plans)), key=lambda i: plans[i].estimate)
+    estimate = plans[driver].estimate
+    for i, plan in enumerate(plans):
+        if i != driver and total:
+            relation = pattern.relations[i - 1] if i > driver else pattern.relations[i]
+            estimate *= relation.width() * plan.estimate / total
+    plan = PatternPlan(pattern, plans, driver, int(round(estimate)))
+    if page_size and estimate >= math.sqrt(page_size * total):
+        plan.strategy = 'scan'
+    return plan
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.lexemes = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = _LEXEME.match(text, pos)
+            if not match:
+                pos = len(text) - len(text[pos:].lstrip())
+                raise ValueError(f"Шаблон: непонятный символ в позиции {pos + 1}: {text[pos:pos + 10]!r}")
+            self.lexemes.append((match.lastgroup, match.group(match.lastgroup)))
+            pos = match.end()
+        self.pos = 0
+
+    def peek(self):
+        return self.lexemes[self.pos] if self.pos < len(self.lexemes) else (None, None)
+
+    def take(self, kind=None, value=None):
+        lexeme = self.peek()
+        if lexeme[0] is None or (kind and lexeme[0] != kind) or (value and lexeme[1] != value):
+            expected = value or {'number': "число", 'name': "имя"}.get(kind, "продолжение")
+            found = lexeme[1] or "конец шаблона"
+            raise ValueError(f"Шаблон: ожидалось {expected}, найдено {found}")
+        self.pos += 1
+        return lexeme[1]
+
+    def pattern(self):
+        elements = [self.element()]
+        relations = []
+        while self.peek()[0] is not None:
+            relations.append(self.relation())
+            elements.append(self.element())
+        return Pattern(elements, relations)
+
+    def relation(self):
+        kind, value = self.peek()
+        if value == '+':
+            self.take()
+            return Relation(True, 1)
+        if value in ('>', '~'):
+            self.take()
+            return Relation(value == '>', self.distance())
+        if kind == 'name' and value.lower() == 'within':
+            self.take()
+            distance = self.distance()
+            if self.peek()[0] == 'name' and self.peek()[1].lower() in ('token', 'tokens'):
+                self.take()
+            if self.peek()[0] == 'name' and self.peek()[1].lower() == 'of':
+                self.take()
+            return Relation(False, distance)
+        raise ValueError(f"Шаблон: ожидалось '+', '>N', '~N' или 'within N tokens of', найдено {value}")
+
+    def distance(self):
+        distance = int(self.take('number'))
+        if distance < 1:
+            raise ValueError("Шаблон: расстояние должно быть не меньше 1")
+        return distance
+
+    def element(self):
+        element = PatternElement()
+        kind, value = self.peek()
+        following = self.lexemes[self.pos + 1][0] if self.pos + 1 < len(self.lexemes) else None
+        if kind == 'name' and value.lower() in ('lemma', 'word') and following in ('lemma', 'word'):
+            # Префиксная форма: lemma 'идти', word "шёл" (поле задаёт имя, а не кавычки)
+            field_name = self.take().lower()
+            setattr(element, field_name, self.take()[1:-1])
+        elif kind == 'lemma':
+            element.lemma = self.take()[1:-1]
+        elif kind == 'word':
+            element.word = self.take()[1:-1]
+        elif kind == 'name':
+            element.features['pos'] = self.take().upper()
+        elif value == '*':
+            self.take()
+        elif value != '[':
+            raise ValueError(f"Шаблон: ожидался элемент, найдено {value or 'конец шаблона'}")
+        if self.peek()[1] == '[':
+            self.take()
+            while True:
+                feature = self.take('name')
+                self.take('symbol', '=')
+                kind, value = self.peek()
+                if kind not in ('name', 'number', 'lemma', 'word'):
+                    raise ValueError(f"Шаблон: нет значения признака {feature}")
+                self.take()
+                if kind in ('lemma', 'word'):
+                    value = value[1:-1]
+                if feature.lower() == 'lemma':
+                    element.lemma = value
+                elif feature.lower() == 'word':
+                    element.word = value
+                elif feature.lower() == 'pos':
+                    element.features['pos'] = value.upper()
+                else:
+                    element.features[feature] = value
+                if self.peek()[1] != ',':
+                    break
+                self.take()
+            self.take('symbol', ']')
+        return element
+
+
+def parse_pattern(text: str) -> Pattern:
+    """
+    Разбор шаблона вида "ADJ[Case=Gen] + NOUN[Case=Gen]" или
+    "lemma 'идти' within 3 tokens of NOUN[Animacy=Anim]".
+
+    Элемент: 'лемма' (или lemma 'лемма'), "словоформа" (или word "словоформа"),
+    ЧАСТЬ_РЕЧИ или '*' и необязательные признаки в скобках
+    [Признак=Значение, ...] (также lemma=, word=, pos=).
+    Между элементами: '+' — следующий токен, '>N' — правее не дальше N
+    токенов, '~N' или 'within N [tokens] of' — с любой стороны не дальше
+    N токенов.
+    Ошибки синтаксиса — ValueError.
+    """
+    if not text or not text.strip():
+        raise ValueError("Шаблон: пустой запрос")
+    return _Parser(text).pattern()
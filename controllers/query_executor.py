@@ -0,0 +1,87 @@
+import queue
+import sqlite3
+from threading import Event, Lock, Thread
+
+
+class _Channel:
+    """Очередь из одного задания: новое задание вытесняет ещё не начатое."""
+
+    def __init__(self):
+        self.generation = 0
+        self.pending = None
+        self.wakeup = Event()
+
+
+class QueryExecutor:
+    """
+    Выполнение запросов вне потока интерфейса.
+
+    Задания разбиты по каналам ('search', 'concordance', ...), у каждого
+    канала свой рабочий поток. Новое задание канала делает предыдущие
+    устаревшими: ещё не начатые отбрасываются, выполняющийся запрос SQLite
+    прерывается обработчиком прогресса соединения чтения (Database.set_cancel_check),
+    результаты устаревших заданий не доставляются.
+
+    Колбэки вызываются в потоке интерфейса из deliver(), который вызывается
+    периодически через root.after.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._channels = {}
+        self._lock = Lock()
+        self._results = queue.Queue()
+
+    def submit(self, channel, func, on_done, on_error=None):
+        """Поставить func() в канал; on_done(результат) / on_error(исключение)."""
+        with self._lock:
+            ch = self._channels.get(channel)
+            if ch is None:
+                ch = self._channels[channel] = _Channel()
+                Thread(target=self._run, args=(ch,), daemon=True).start()
+            ch.generation += 1
+            ch.pending = (ch.generation, func, on_done, on_error)
+            ch.wakeup.set()
+            return ch.generation
+
+    def cancel(self, channel):
+        """Сделать устаревшими все задания канала."""
+        with self._lock:
+            ch = self._channels.get(channel)
+            if ch is not None:
+                ch.generation += 1
+                ch.pending = None
+
+    def _run(self, ch):
+        while True:
+            ch.wakeup.wait()
+            with self._lock:
+                job, ch.pending = ch.pending, None
+                ch.wakeup.clear()
+            if job is None:
+                continue
+            generation, func, on_done, on_error = job
+            is_stale = lambda: ch.generation != generation
+            self.db.set_cancel_check(is_stale)
+            try:
+                result = func()
+            except sqlite3.OperationalError as e:
+                # "interrupted" — запрос прерван, потому что стал ненужным
+                if not is_stale():
+                    self._results.put((ch, generation, on_error, e))
+            except Exception as e:
+                self._results.put((ch, generation, on_error, e))
+            else:
+                self._results.put((ch, generation, on_done, result))
+            finally:
+                self.db.set_cancel_check(None)
+
+    def deliver(self):
+        """Вызвать колбэки готовых актуальных заданий (в потоке интерфейса)."""
+        while True:
+            try:
+                ch, generation, callback, value = self._results.get_nowait()
+            except queue.Empty:
+                return
+            if callback is not None and ch.generation == generation:
+                callback(value)
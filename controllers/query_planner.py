@@ -0,0 +1,144 @@
+import json
+import math
+from dataclasses import dataclass
+from typing import Any, List
+
+
+@dataclass
+class Condition:
+    """
+    Условие поиска по tokens. template ссылается на столбцы через {c}
+    ('{c}pos = ?'): ведущее условие выбирает id токенов по своему индексу
+    index, остальные проверяются на найденных строках с отключённым
+    индексом (унарный «+»).
+    estimate — число токенов, удовлетворяющих условию, по value_stats.
+    kind — вид значения ('lemma', 'token', 'pos', 'bundle'): условия без
+    'bundle' применимы и к частотным таблицам (столбцы называются так же).
+    """
+    label: str
+    template: str
+    params: List[Any]
+    index: str
+    estimate: int = 0
+    # вхождения из инвертированного индекса, если условие по ним
+    postings: Any = None
+    kind: str = ''
+
+    def driver_sql(self, alias='t'):
+        if self.postings is not None:
+            # столбец token_id вхождений
+            return f"{alias}.id IN (SELECT value FROM json_each(?))", [json.dumps(self.postings[:, 2].tolist())]
+        # Подзапрос с единственным условием SQLite выполняет по индексу
+        # self.index; INDEXED BY не указывается: во время пакетной загрузки
+        # с drop_indexes индекса нет, и запрос должен выполниться перебором
+        return (
+            f"{alias}.id IN (SELECT x.id FROM tokens x WHERE {self.template.format(c='x.')})",
+            list(self.params)
+        )
+
+    def filter_sql(self, alias='t'):
+        return self.template.format(c=f'+{alias}.'), list(self.params)
+
+
+@dataclass
+class Plan:
+    """Условия в порядке выполнения: первое — ведущее, остальные — фильтры."""
+    conditions: List[Condition]
+    total: int
+    estimate: int
+    strategy: str = 'sort'
+
+    @property
+    def driver(self):
+        return self.conditions[0] if self.conditions else None
+
+    def where(self, use_driver=True, start=0, alias='t'):
+        """
+        Условия WHERE и параметры начиная с условия start для токенов alias.
+        use_driver=False — все условия как фильтры (при проходе по предложениям).
+        """
+        where, params = [], []
+        for i, cond in enumerate(self.conditions[start:], start):
+            if use_driver and i == 0:
+                # единственное условие SQLite и так выполнит по его индексу
+                alone = len(self.conditions) == 1 and cond.postings is None
+                sql, cond_params = (
+                    (cond.template.format(c=f'{alias}.'), list(cond.params)) if alone else cond.driver_sql(alias)
+                )
+            else:
+                sql, cond_params = cond.filter_sql(alias)
+            where.append(sql)
+            params.extend(cond_params)
+        return where, params
+
+    def frequency_where(self):
+        """
+        Условия и параметры для частотной таблицы f (Database._create_frequencies)
+        или None, если среди условий есть грамматические признаки.
+        """
+        if any(cond.kind == 'bundle' for cond in self.conditions):
+            return None
+        where, params = [], []
+        for cond in self.conditions:
+            where.append(cond.template.format(c='f.'))
+            params.extend(cond.params)
+        return where, params
+
+
+class QueryPlanner:
+    """
+    Выбор порядка выполнения условий поиска по статистике value_stats
+    (число токенов для каждой леммы, словоформы, части речи и набора
+    признаков). Выборка начинается с самого селективного условия по его
+    индексу, остальные проверяются на найденных строках. Для постраничной
+    выдачи выбирается также способ упорядочивания (см. plan).
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def total(self, conn):
+        return conn.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM value_stats WHERE kind = 'token'"
+        ).fetchone()[0]
+
+    def value_count(self, conn, kind, value):
+        row = conn.execute(
+            "SELECT count FROM value_stats WHERE kind = ? AND value = ?", (kind, value)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def range_count(self, conn, kind, low, high):
+        return conn.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM value_stats WHERE kind = ? AND value >= ? AND value < ?",
+            (kind, low, high)
+        ).fetchone()[0]
+
+    def subquery_count(self, conn, kind, subquery, params):
+        """Число токенов со значениями из подзапроса (формы словаря, наборы признаков)."""
+        return conn.execute(
+            f"SELECT COALESCE(SUM(count), 0) FROM value_stats WHERE kind = ? AND value IN ({subquery})",
+            [kind, *params]
+        ).fetchone()[0]
+
+    def plan(self, conn, conditions, page_size=None):
+        """
+        Упорядочивает условия по возрастанию оценки. Оценка результата —
+        в предположении независимости условий: N · Π(n_i / N).
+
+        page_size — план постраничной выдачи: сортировка найденных строк
+        стоит порядка их числа n, проход по токенам в порядке (документ,
+        предложение, позиция) до заполнения страницы — порядка page_size · N / n;
+        проход ('scan') выбирается при n > sqrt(page_size · N).
+        """
+        total = self.total(conn)
+        ordered = sorted(conditions, key=lambda cond: cond.estimate)
+        estimate = total
+        for cond in ordered:
+            estimate = estimate * cond.estimate / total if total else 0
+        plan = Plan(ordered, total, int(round(estimate)))
+        if ordered and ordered[0].postings is not None:
+            plan.strategy = 'postings'
+        elif page_size and (not ordered or estimate >= math.sqrt(page_size * total)):
+            plan.strategy = 'scan'
+        return plan
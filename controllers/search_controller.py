@@ -1,3 +1,4 @@
+import json
 from typing import Any, Dict, List, Tuple
 from models.database import Database
 from utils.russian_translator import RussianTranslator
@@ -5,12 +6,80 @@ from typing import List, Tuple, Any
 from models.database import Database
 from utils.russian_translator import RussianTranslator
 from config import Config
+from models.query_cache import QueryCache
+from controllers.query_planner import Condition, QueryPlanner
+from controllers.pattern_query import parse_pattern, plan_pattern
+
+# Символ больше любого другого: [q, q + PREFIX_UPPER_BOUND) — все строки с префиксом q
+PREFIX_UPPER_BOUND = '\U0010ffff'
+# Столбцы вхождений инвертированного индекса (models.inverted_index;
+# сам модуль с numpy импортируется, только если индекс построен)
+DOC, SENTENCE, TOKEN = 0, 1, 2
+# Сколько вхождений из инвертированного индекса проверяется одним запросом
+CONCORDANCE_BLOCK = 5000
 
 class SearchController:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, index=None, cache: QueryCache = None):
         self.db = db
+        # Инвертированный индекс (models.inverted_index.InvertedIndex) или None
+        self.index = index
         self.translator = RussianTranslator()
+        # Результаты запросов текущей версии корпуса
+        self.cache = cache or QueryCache()
+        self.planner = QueryPlanner(db)
+
+    def _cached(self, key, compute):
+        """Результат из кэша или compute(); версия берётся до вычисления,
+        чтобы результат, посчитанный во время записи, не пережил её."""
+        version = self.db.corpus_version
+        found, value = self.cache.get(key, version)
+        if found:
+            return value
+        value = compute()
+        self.cache.put(key, version, value)
+        return value
+
+    @staticmethod
+    def _filters_key(filters: Dict[str, str]):
+        return tuple(sorted((feat, val) for feat, val in filters.items() if val))
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def _lookup_index(self, kind: str, key: str):
+        """Вхождения из инвертированного индекса или None, если индекса нет."""
+        if self.index is None:
+            return None
+        return self.index.lookup(kind, key)
     
+    def substring_condition(self, search_type: str, query: str) -> Tuple[str, List[Any]]:
+        """
+        Условие «лемма/словоформа содержит query» для запроса по tokens t.
+        Подстрока ищется в словаре lexicon (по триграммному индексу, если он
+        есть и запрос не короче 3 символов), найденные формы соединяются
+        с tokens по индексу idx_lemma_fold/idx_token_fold.
+        """
+        column, _, lookup, params = self._substring_lookup(search_type, query)
+        return f"{column} IN ({lookup})", params
+
+    def _substring_lookup(self, search_type, query):
+        """(столбец tokens, вид формы, подзапрос к lexicon, параметры)."""
+        column, kind = {
+            'Лемма': ('t.lemma_fold', 'lemma'),
+            'Словоформа': ('t.token_fold', 'token'),
+        }[search_type]
+        query = query.strip().casefold()
+        if self.db.has_trigram_index and len(query) >= 3:
+            lookup = (
+                "SELECT l.form FROM lexicon l WHERE l.kind = ? AND l.id IN "
+                "(SELECT rowid FROM lexicon_trigrams WHERE lexicon_trigrams MATCH ?)"
+            )
+            params = [kind, '"' + query.replace('"', '""') + '"']
+        else:
+            lookup = "SELECT form FROM lexicon WHERE kind = ? AND instr(form, ?) > 0"
+            params = [kind, query]
+        return column, kind, lookup, params
+
     def get_grammar(
         self,
         token_text: str,
@@ -18,20 +87,24 @@ class SearchController:
         pos: str,
         doc_title: str
     ) -> list[tuple[str, str]]:
+        key = ('grammar', token_text.casefold(), lemma.casefold(), pos, doc_title)
+        return self._cached(key, lambda: self._get_grammar(token_text, lemma, pos, doc_title))
+
+    def _get_grammar(self, token_text, lemma, pos, doc_title):
         feats = []
-        with self.db.lock, self.db.conn:
-            cur = self.db.conn.cursor()
+        with self.db.reader() as conn:
+            cur = conn.cursor()
             cur.execute("""
                 SELECT gf.feature, gf.value
                 FROM tokens t
                 JOIN sentences s ON t.sentence_id = s.id
                 JOIN documents d ON s.doc_id = d.id
-                JOIN grammar_features gf ON gf.token_id = t.id
-                WHERE LOWER(t.token) = LOWER(?)
-                AND LOWER(t.lemma) = LOWER(?)
+                JOIN bundle_features gf ON gf.bundle_id = t.bundle_id
+                WHERE t.token_fold = ?
+                AND t.lemma_fold = ?
                 AND t.pos = ?
                 AND d.title = ?
-            """, (token_text, lemma, pos, doc_title))
+            """, (token_text.casefold(), lemma.casefold(), pos, doc_title))
             raw_feats = cur.fetchall()
             
             for feature, value in raw_feats:
@@ -39,130 +112,542 @@ class SearchController:
                 feats.append((feature, translated.get(feature, value)))
                 
         return feats
+
     def get_concordance(
         self,
         token_text: str,
         context_left: int = 5,
-        context_right: int = 5
+        context_right: int = 5,
+        limit: int = Config.CONCORDANCE_PAGE_SIZE,
+        offset: int = 0
     ) -> List[str]:
         """
         Для каждого вхождения token_text возвращает контекст:
         context_left токенов слева + сам токен + context_right токенов справа.
+        Возвращается страница из limit вхождений начиная с offset (limit=None — все).
         """
-        concordances: List[str] = []
-        with self.db.lock, self.db.conn:
-            cur = self.db.conn.cursor()
-            # получаем все пары (token_id, sentence_id) для данного текста токена
-            cur.execute(
-                "SELECT id, sentence_id FROM tokens WHERE token = ?",
-                (token_text,)
-            )
-            hits = cur.fetchall()  # [(token_id, sentence_id), ...]
-
-            for token_id, sent_id in hits:
-                # забираем все токены этого предложения в порядке появления
-                cur.execute(
-                    "SELECT id, token FROM tokens "
-                    "WHERE sentence_id = ? "
-                    "ORDER BY start",
-                    (sent_id,)
-                )
-                tokens = cur.fetchall()  # [(id1, tok1), (id2, tok2), ...]
+        key = ('concordance', token_text, context_left, context_right, limit, offset)
+        return self._cached(
+            key,
+            lambda: list(self.iter_concordance(token_text, context_left, context_right, limit, offset))
+        )
 
-                # выделяем списки отдельно
-                ids = [row[0] for row in tokens]
-                texts = [row[1] for row in tokens]
-
-                # находим позицию нашего токена
-                try:
-                    idx = ids.index(token_id)
-                except ValueError:
-                    continue
-
-                # формируем контекст
-                left = texts[max(0, idx - context_left): idx]
-                center = texts[idx]
-                right = texts[idx + 1: idx + 1 + context_right]
+    def iter_concordance(
+        self,
+        token_text: str,
+        context_left: int = 5,
+        context_right: int = 5,
+        limit: int = None,
+        offset: int = 0
+    ):
+        """
+        Потоковая выдача строк конкорданса. Окна контекста всех вхождений
+        читаются одним запросом по (sentence_id, position) вместо запроса
+        на каждое вхождение.
+        """
+        with self.db.reader() as conn:
+            postings = self._lookup_index('token', token_text.casefold())
+            if postings is None:
+                blocks = [(
+                    "SELECT id, sentence_id, position FROM tokens "
+                    "WHERE token = ? ORDER BY id LIMIT ? OFFSET ?",
+                    [token_text, -1 if limit is None else limit, offset]
+                )]
+                skip = 0
+            else:
+                # индекс хранит формы без учёта регистра — точное совпадение
+                # проверяется в запросе, вхождения читаются блоками
+                token_ids = postings[:, TOKEN]
+                blocks = (
+                    (
+                        "SELECT id, sentence_id, position FROM tokens "
+                        "WHERE id IN (SELECT value FROM json_each(?)) AND token = ? ORDER BY id",
+                        [json.dumps(token_ids[i:i + CONCORDANCE_BLOCK].tolist()), token_text]
+                    )
+                    for i in range(0, len(token_ids), CONCORDANCE_BLOCK)
+                )
+                skip = offset
 
-                concordances.append(" ".join(left + [center] + right))
+            remaining = limit
+            for hits_sql, hits_params in blocks:
+                for line in self._concordance_lines(conn, hits_sql, hits_params, context_left, context_right):
+                    if skip:
+                        skip -= 1
+                        continue
+                    if remaining is not None:
+                        if remaining <= 0:
+                            return
+                        remaining -= 1
+                    yield line
 
-        return concordances
+    def _concordance_lines(self, conn, hits_sql, hits_params, context_left, context_right):
+        cur = conn.execute(f"""
+            WITH hits AS ({hits_sql})
+            SELECT h.id, c.token
+            FROM hits h
+            JOIN tokens c ON c.sentence_id = h.sentence_id
+                AND c.position BETWEEN h.position - ? AND h.position + ?
+            ORDER BY h.id, c.position
+        """, [*hits_params, context_left, context_right])
+        current_id, words = None, []
+        for hit_id, word in cur:
+            if hit_id != current_id:
+                if words:
+                    yield " ".join(words)
+                current_id, words = hit_id, []
+            words.append(word)
+        if words:
+            yield " ".join(words)
 
-    def search(
+    def _conditions(
         self,
+        conn,
         search_type: str,
         query: str,
         filters: Dict[str, str],
-        context_left: int = Config.CONTEXT_LEFT,
-        context_right: int = Config.CONTEXT_RIGHT,
-        partial_match: bool = False
-    ) -> List[Tuple[Any, ...]]:
-        where = []
-        params = []
-        query = query.strip()
+        partial_match: bool = False,
+        substring: bool = False
+    ) -> List[Condition]:
+        """
+        Условия поиска по tokens t с оценками числа строк (см. QueryPlanner).
+        Частичное совпадение — по префиксу, а при substring=True — по подстроке.
+        """
+        conditions = []
+        filters = dict(filters)
+        query = query.strip().casefold()
+        planner = self.planner
 
-        # Базовый поиск
-        if search_type == 'Лемма':
-            if partial_match:
-                where.append("LOWER(t.lemma) LIKE LOWER(?) || '%'")
+        # Базовый поиск по приведённым к нижнему регистру столбцам:
+        # точное совпадение и префикс (диапазон) используют индекс
+        column, kind = {
+            'Лемма': ('t.lemma_fold', 'lemma'),
+            'Словоформа': ('t.token_fold', 'token'),
+        }.get(search_type, (None, None))
+        if column and query:
+            name = column[2:]
+            index = 'idx_' + name
+            if partial_match and substring:
+                _, kind, lookup, params = self._substring_lookup(search_type, query)
+                conditions.append(Condition(
+                    f"{kind} ~ *{query}*", f"{{c}}{name} IN ({lookup})", params, index,
+                    planner.subquery_count(conn, kind, lookup, params), kind=kind
+                ))
+            elif partial_match:
+                params = [query, query + PREFIX_UPPER_BOUND]
+                conditions.append(Condition(
+                    f"{kind} ~ {query}*", f"{{c}}{name} >= ? AND {{c}}{name} < ?", params, index,
+                    planner.range_count(conn, kind, *params), kind=kind
+                ))
             else:
-                where.append("LOWER(t.lemma) = LOWER(?)")
-            params.append(query)
-        
-        elif search_type == 'Словоформа':
-            if partial_match:
-                where.append("LOWER(t.token) LIKE LOWER(?) || '%'")
-            else:
-                where.append("LOWER(t.token) = LOWER(?)")
-            params.append(query)
+                postings = self._lookup_index(kind, query)
+                if postings is not None:
+                    # точное совпадение: вхождения берутся из инвертированного индекса
+                    conditions.append(Condition(
+                        f"{kind} = {query} (инвертированный индекс)", f"{{c}}{name} = ?", [query], index,
+                        len(postings), postings, kind
+                    ))
+                else:
+                    conditions.append(Condition(
+                        f"{kind} = {query}", f"{{c}}{name} = ?", [query], index,
+                        planner.value_count(conn, kind, query), kind=kind
+                    ))
 
         # Фильтры из панели
         if 'pos' in filters:
             pos_code = self.translator.translate_filter_display("pos", filters.pop('pos'))
             if pos_code:
-                where.append("t.pos = ?")
-                params.append(pos_code)
+                conditions.append(Condition(
+                    f"pos = {pos_code}", "{c}pos = ?", [pos_code], 'idx_pos',
+                    planner.value_count(conn, 'pos', pos_code), kind='pos'
+                ))
 
-        # Грамматические фильтры
+        # Грамматические фильтры: пересечение наборов признаков по индексу
+        # bundle_features, затем поиск токенов по idx_bundle
+        bundle_queries = []
+        params = []
+        labels = []
         for feat, rus_val in filters.items():
             if rus_val:
                 code_val = self.translator.translate_filter_display(feat, rus_val)
-                where.append(
-                    "EXISTS(SELECT 1 FROM grammar_features gf "
-                    "WHERE gf.token_id = t.id AND gf.feature = ? AND gf.value = ?)"
+                bundle_queries.append(
+                    "SELECT bundle_id FROM bundle_features WHERE feature = ? AND value = ?"
                 )
                 params.extend([feat, code_val])
+                labels.append(f"{feat}={code_val}")
+        if bundle_queries:
+            bundles = " INTERSECT ".join(bundle_queries)
+            conditions.append(Condition(
+                "|".join(labels), f"{{c}}bundle_id IN ({bundles})", params, 'idx_bundle',
+                planner.subquery_count(conn, 'bundle', bundles, params), kind='bundle'
+            ))
+        return conditions
+
+    def _plan(self, conn, search_type, query, filters, partial_match=False, substring=False, page_size=None):
+        conditions = self._conditions(conn, search_type, query, filters, partial_match, substring)
+        return self.planner.plan(conn, conditions, page_size)
+
+    def search_page(
+        self,
+        search_type: str,
+        query: str,
+        filters: Dict[str, str],
+        partial_match: bool = False,
+        after: Tuple[int, int, int] = None,
+        page_size: int = None,
+        substring: bool = False
+    ) -> Tuple[List[Tuple[Any, ...]], Any]:
+        """
+        Страница вхождений в порядке (документ, предложение, позиция).
 
-        # Формирование SQL-запроса (ИСПРАВЛЕННАЯ ЧАСТЬ)
+        Строки: (token, lemma, pos, title, sentence_text, doc_id, sentence_id, position).
+        after — курсор предыдущей страницы (doc_id, sentence_id, position):
+        выборка продолжается строго после него без OFFSET.
+        Возвращает (строки, курсор следующей страницы или None).
+        """
+        page_size = page_size or Config.SEARCH_PAGE_SIZE
+        key = (
+            'page', search_type, query.strip().casefold(), self._filters_key(filters),
+            partial_match, substring, tuple(after) if after is not None else None, page_size
+        )
+        return self._cached(
+            key,
+            lambda: self._search_page(search_type, query, filters, partial_match, after, page_size, substring)
+        )
+
+    def _search_page(self, search_type, query, filters, partial_match, after, page_size, substring):
+        with self.db.reader() as conn:
+            plan = self._plan(conn, search_type, query, filters, partial_match, substring, page_size)
+            if plan.strategy != 'postings':
+                scan = plan.strategy == 'scan'
+                where, params = plan.where(use_driver=not scan)
+                rows = self._page_rows(conn, where, params, after, page_size, scan=scan)
+            else:
+                # остальные условия проверяются на вхождениях индекса блоками
+                postings = plan.driver.postings
+                where, params = plan.where(start=1)
+                # Вхождения в индексе уже упорядочены по (документ, предложение, токен):
+                # пропускаем предшествующие курсору и проверяем остальные блоками
+                if after is not None:
+                    doc_start = int(postings[:, DOC].searchsorted(after[0]))
+                    doc_end = int(postings[:, DOC].searchsorted(after[0], side='right'))
+                    start = doc_start + int(postings[doc_start:doc_end, SENTENCE].searchsorted(after[1]))
+                    postings = postings[start:]
+                token_ids = postings[:, TOKEN]
+                rows = []
+                # без дополнительных условий каждое вхождение попадает в выдачу
+                block = max(page_size, CONCORDANCE_BLOCK) if where else page_size
+                for i in range(0, len(token_ids), block):
+                    rows.extend(self._page_rows(
+                        conn,
+                        ["t.id IN (SELECT value FROM json_each(?))"] + where,
+                        [json.dumps(token_ids[i:i + block].tolist())] + params,
+                        after,
+                        page_size - len(rows)
+                    ))
+                    if len(rows) >= page_size:
+                        break
+
+        cursor = tuple(rows[-1][5:8]) if len(rows) >= page_size else None
+        return rows, cursor
+
+    def _page_rows(self, conn, where, params, after, limit, scan=False):
+        where = list(where)
+        params = list(params)
+        if after is not None:
+            # первое условие позволяет начать проход по idx_sentences_doc с курсора
+            where.append("(s.doc_id, s.id) >= (?, ?) AND (s.doc_id, s.id, t.position) > (?, ?, ?)")
+            params.extend([after[0], after[1], *after])
+        if scan:
+            # Порядок соединения задан явно: предложения по idx_sentences_doc,
+            # их токены по idx_sentence_position, сортировка не нужна
+            source = """
+                FROM sentences s
+                CROSS JOIN tokens t INDEXED BY idx_sentence_position ON t.sentence_id = s.id
+                JOIN documents d ON s.doc_id = d.id
+            """
+        else:
+            source = """
+                FROM tokens t
+                JOIN sentences s ON t.sentence_id = s.id
+                JOIN documents d ON s.doc_id = d.id
+            """
         sql = """
-            SELECT 
-                t.token,
-                t.lemma,
-                t.pos,
-                d.title,
-                COUNT(*) as count 
-            FROM tokens t
-            JOIN sentences s ON t.sentence_id = s.id
-            JOIN documents d ON s.doc_id = d.id
-        """
-        
+            SELECT t.token, t.lemma, t.pos, d.title, s.sentence_text,
+                   s.doc_id, s.id, t.position
+        """ + source
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY s.doc_id, s.id, t.position LIMIT ?"
+        return conn.execute(sql, [*params, limit]).fetchall()
+
+    def iter_search(
+        self,
+        search_type: str,
+        query: str,
+        filters: Dict[str, str],
+        partial_match: bool = False,
+        page_size: int = None,
+        substring: bool = False
+    ):
+        """Все вхождения постранично (генератор), без ограничения числа результатов."""
+        after = None
+        while True:
+            # страницы полного обхода не кэшируются, чтобы не вытеснять остальное
+            rows, after = self._search_page(
+                search_type, query, filters, partial_match, after,
+                page_size or Config.SEARCH_PAGE_SIZE, substring
+            )
+            yield from rows
+            if after is None:
+                return
+
+    def count(
+        self,
+        search_type: str,
+        query: str,
+        filters: Dict[str, str],
+        partial_match: bool = False,
+        substring: bool = False
+    ) -> int:
+        """Общее число вхождений (может выполняться в отдельном потоке)."""
+        key = ('count', search_type, query.strip().casefold(), self._filters_key(filters), partial_match, substring)
+        return self._cached(
+            key, lambda: self._count(search_type, query, filters, partial_match, substring)
+        )
+
+    def _count(self, search_type, query, filters, partial_match, substring):
+        with self.db.reader() as conn:
+            plan = self._plan(conn, search_type, query, filters, partial_match, substring)
+            if len(plan.conditions) == 1 and plan.driver.postings is not None:
+                return len(plan.driver.postings)
+            frequency = plan.frequency_where()
+            if frequency is not None:
+                # лемма и часть речи — по меньшей из частотных таблиц
+                table = 'lemma_frequencies' if all(
+                    cond.kind in ('lemma', 'pos') for cond in plan.conditions
+                ) else 'form_frequencies'
+                where, params = frequency
+                sql = f"SELECT COALESCE(SUM(f.count), 0) FROM {table} f"
+                if where:
+                    sql += " WHERE " + " AND ".join(where)
+                return conn.execute(sql, params).fetchone()[0]
+            return self._count_rows(conn, plan)
+
+    def _count_rows(self, conn, plan):
+        where, params = plan.where()
+        sql = "SELECT COUNT(*) FROM tokens t"
         if where:
             sql += " WHERE " + " AND ".join(where)
-        
-        sql += " GROUP BY t.token, t.lemma, t.pos, d.title ORDER BY d.title LIMIT 500"
+        return conn.execute(sql, params).fetchone()[0]
+
+    def explain(
+        self,
+        search_type: str,
+        query: str,
+        filters: Dict[str, str],
+        partial_match: bool = False,
+        substring: bool = False,
+        page_size: int = None
+    ) -> List[str]:
+        """
+        Выбранный план поиска: условия в порядке выполнения с оценкой и
+        фактическим числом строк, итоговая оценка и факт, план SQLite.
+        """
+        page_size = page_size or Config.SEARCH_PAGE_SIZE
+        lines = []
+        with self.db.reader() as conn:
+            plan = self._plan(conn, search_type, query, filters, partial_match, substring, page_size)
+            lines.append(f"Токенов в корпусе: {plan.total}")
+            for i, cond in enumerate(plan.conditions):
+                cond_sql, cond_params = cond.driver_sql()
+                actual = conn.execute(
+                    f"SELECT COUNT(*) FROM tokens t WHERE {cond_sql}", cond_params
+                ).fetchone()[0]
+                role = "ведущее" if i == 0 else "фильтр"
+                lines.append(f"  {i + 1}. [{role}] {cond.label}: оценка {cond.estimate}, факт {actual}")
+            lines.append(f"Результат: оценка {plan.estimate}, факт {self._count_rows(conn, plan)}")
+            lines.append(f"Страница ({page_size}): {plan.strategy}")
+            where, params = plan.where()
+            sql = "SELECT t.id FROM tokens t"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+                lines.append(f"  SQLite: {row[-1]}")
+        return lines
+
+    def _plan_pattern(self, conn, pattern, page_size=None):
+        """План шаблона: условия каждого элемента через _conditions (признаки — в кодах UD)."""
+        plans = []
+        for element in pattern.elements:
+            lemma = element.lemma or ''
+            conditions = self._conditions(
+                conn, 'Лемма', lemma.rstrip('*'), element.features, lemma.endswith('*')
+            )
+            if element.word is not None:
+                conditions += self._conditions(
+                    conn, 'Словоформа', element.word.rstrip('*'), {}, element.word.endswith('*')
+                )
+            plans.append(self.planner.plan(conn, conditions))
+        return plan_pattern(pattern, plans, self.planner.total(conn), page_size)
+
+    def search_pattern(
+        self,
+        pattern: str,
+        after: Tuple[int, ...] = None,
+        page_size: int = None
+    ) -> Tuple[List[Tuple[Any, ...]], Any]:
+        """
+        Страница совпадений шаблона (см. controllers.pattern_query.parse_pattern)
+        в порядке (документ, предложение, позиции элементов).
+
+        Строки: (словоформы, леммы, части речи, title, sentence_text, doc_id,
+        sentence_id, позиции) — словоформы, леммы и части речи элементов через
+        пробел. after — курсор (doc_id, sentence_id, *позиции) предыдущей страницы.
+        Возвращает (строки, курсор следующей страницы или None).
+        """
+        page_size = page_size or Config.SEARCH_PAGE_SIZE
+        parsed = parse_pattern(pattern)
+        key = ('pattern', str(parsed), tuple(after) if after is not None else None, page_size)
+        return self._cached(key, lambda: self._search_pattern(parsed, after, page_size))
 
-        # Выполнение запроса
-        with self.db.lock, self.db.conn:
-            cur = self.db.conn.cursor()
+    def _search_pattern(self, pattern, after, page_size):
+        size = len(pattern.elements)
+        positions = ", ".join(f"t{i}.position" for i in range(size))
+        columns = ", ".join(f"t{i}.token, t{i}.lemma, t{i}.pos" for i in range(size))
+        with self.db.reader() as conn:
+            plan = self._plan_pattern(conn, pattern, page_size)
+            where, params = plan.where()
+            if after is not None:
+                where.append(
+                    f"(s.doc_id, s.id) >= (?, ?) AND (s.doc_id, s.id, {positions}) > "
+                    f"({', '.join('?' * (size + 2))})"
+                )
+                params.extend([after[0], after[1], *after])
+            sql = f"SELECT {columns}, d.title, s.sentence_text, s.doc_id, s.id, {positions}\n"
+            sql += plan.join_sql()
+            if where:
+                sql += "\nWHERE " + " AND ".join(where)
+            sql += f"\nORDER BY s.doc_id, s.id, {positions} LIMIT ?"
+            fetched = conn.execute(sql, [*params, page_size]).fetchall()
+
+        rows = []
+        width = 3 * size
+        for row in fetched:
+            words, lemmas, tags = (
+                " ".join(value or '' for value in row[i:width:3]) for i in range(3)
+            )
+            title, sentence_text, doc_id, sentence_id = row[width:width + 4]
+            rows.append((words, lemmas, tags, title, sentence_text, doc_id, sentence_id, row[width + 4:]))
+        cursor = (rows[-1][5], rows[-1][6], *rows[-1][7]) if len(rows) >= page_size else None
+        return rows, cursor
+
+    def count_pattern(self, pattern: str) -> int:
+        """Число совпадений шаблона."""
+        parsed = parse_pattern(pattern)
+        return self._cached(('pattern_count', str(parsed)), lambda: self._count_pattern(parsed))
+
+    def _count_pattern(self, pattern):
+        with self.db.reader() as conn:
+            plan = self._plan_pattern(conn, pattern)
+            where, params = plan.where()
+            sql = "SELECT COUNT(*)\n" + plan.join_sql()
+            if where:
+                sql += "\nWHERE " + " AND ".join(where)
+            return conn.execute(sql, params).fetchone()[0]
+
+    def explain_pattern(self, pattern: str, page_size: int = None) -> List[str]:
+        """План шаблона: оценки элементов, ведущий элемент, оценка и факт совпадений, план SQLite."""
+        page_size = page_size or Config.SEARCH_PAGE_SIZE
+        parsed = parse_pattern(pattern)
+        lines = [f"Шаблон: {parsed}"]
+        with self.db.reader() as conn:
+            plan = self._plan_pattern(conn, parsed, page_size)
+            for i, (element, element_plan) in enumerate(zip(parsed.elements, plan.plans)):
+                role = "ведущий" if i == plan.driver else "соединение"
+                lines.append(f"  t{i} {element} [{role}]: оценка {element_plan.estimate}")
+            lines.append(f"Совпадений: оценка {plan.estimate}, факт {self._count_pattern(parsed)}")
+            lines.append(f"Страница ({page_size}): {plan.strategy}")
+            where, params = plan.where()
+            sql = "SELECT 1\n" + plan.join_sql()
+            if where:
+                sql += "\nWHERE " + " AND ".join(where)
+            for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+                lines.append(f"  SQLite: {row[-1]}")
+        return lines
+
+    def search(
+        self,
+        search_type: str,
+        query: str,
+        filters: Dict[str, str],
+        context_left: int = Config.CONTEXT_LEFT,
+        context_right: int = Config.CONTEXT_RIGHT,
+        partial_match: bool = False
+    ) -> List[Tuple[Any, ...]]:
+        """Сводка вхождений: (token, lemma, pos, title, count) по документам."""
+        key = ('search', search_type, query.strip().casefold(), self._filters_key(filters), partial_match)
+        return self._cached(key, lambda: self._search(search_type, query, filters, partial_match))
+
+    def _search(self, search_type, query, filters, partial_match):
+        with self.db.reader() as conn:
+            plan = self._plan(conn, search_type, query, filters, partial_match)
+            frequency = plan.frequency_where()
+            if frequency is not None:
+                # Без грамматических признаков сводка уже посчитана в form_frequencies
+                where, params = frequency
+                sql = """
+                    SELECT
+                        NULLIF(f.token, ''),
+                        NULLIF(f.lemma, ''),
+                        NULLIF(f.pos, ''),
+                        d.title,
+                        f.count
+                    FROM form_frequencies f
+                    JOIN documents d ON d.id = f.doc_id
+                """
+                if where:
+                    sql += " WHERE " + " AND ".join(where)
+                sql += " ORDER BY d.title"
+                return conn.execute(sql, params).fetchall()
+
+            sql = """
+                SELECT 
+                    t.token,
+                    t.lemma,
+                    t.pos,
+                    d.title,
+                    COUNT(*) as count 
+                FROM tokens t
+                JOIN sentences s ON t.sentence_id = s.id
+                JOIN documents d ON s.doc_id = d.id
+            """
+            where, params = plan.where()
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " GROUP BY t.token, t.lemma, t.pos, d.title ORDER BY d.title"
+            cur = conn.cursor()
             cur.execute(sql, params)
             return cur.fetchall()
-            
 
-        def _translate_pos_to_code(self, pos: str) -> str:
-            rev_pos = {
-                "Существительное": "NOUN",
-                "Глагол": "VERB",
-                "Прилагательное": "ADJ",
-                # ... остальные части речи
-            }
-            return rev_pos.get(pos.strip().capitalize(), "")
\ No newline at end of file
+    def frequencies(self, kind: str = 'lemma', doc_id: int = None, limit: int = 100) -> List[Tuple[Any, ...]]:
+        """
+        Частотный список: (лемма, часть речи, число) при kind='lemma' или
+        (словоформа, число) при kind='token' — по всему корпусу или документу doc_id.
+        """
+        key = ('frequencies', kind, doc_id, limit)
+        return self._cached(key, lambda: self._frequencies(kind, doc_id, limit))
+
+    def _frequencies(self, kind, doc_id, limit):
+        if kind == 'lemma':
+            columns, table = "lemma_fold, pos", 'lemma_frequencies'
+        else:
+            columns, table = "token_fold", 'form_frequencies'
+        sql = f"SELECT {columns}, SUM(count) FROM {table}"
+        params = []
+        if doc_id is not None:
+            sql += " WHERE doc_id = ?"
+            params.append(doc_id)
+        sql += f" GROUP BY {columns} ORDER BY SUM(count) DESC, {columns} LIMIT ?"
+        params.append(limit)
+        with self.db.reader() as conn:
+            return conn.execute(sql, params).fetchall()
@@ -0,0 +1,115 @@
+class BulkWriter:
+    """
+    Пакетная запись аннотаций документа: идентификаторы предложений и токенов
+    назначаются на стороне Python, вставка выполняется через executemany
+    без обращений к lastrowid.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        # Набор признаков (кортеж пар) -> feature_bundles.id
+        self._bundle_ids = {}
+
+    @staticmethod
+    def parse_bundle(bundle):
+        """'Case=Gen|Number=Plur' (feature_bundles.bundle) → (('Case', 'Gen'), ('Number', 'Plur'))."""
+        if not bundle:
+            return None
+        return tuple(tuple(item.split('=', 1)) for item in bundle.split('|') if '=' in item)
+
+    def _next_id(self, cur, table):
+        cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        return cur.fetchone()[0] + 1
+
+    def _bundle_id(self, cur, feats, found):
+        """
+        Идентификатор набора признаков; новый набор добавляется в словарь.
+        found — наборы, найденные или добавленные в текущей транзакции: в кэш
+        они переносятся только после её фиксации (id отменённой вставки
+        получит следующий новый набор).
+        """
+        if not feats:
+            return None
+        # Канонический ключ: списки из JSON/XML и кортежи natasha дают один и тот же
+        pairs = tuple(sorted((str(key), str(val)) for key, val in feats))
+        bundle_id = self._bundle_ids.get(pairs) or found.get(pairs)
+        if bundle_id is not None:
+            return bundle_id
+        bundle = '|'.join(f"{key}={val}" for key, val in pairs)
+        cur.execute("SELECT id FROM feature_bundles WHERE bundle = ?", (bundle,))
+        row = cur.fetchone()
+        if row:
+            bundle_id = row[0]
+        else:
+            cur.execute("INSERT INTO feature_bundles (bundle) VALUES (?)", (bundle,))
+            bundle_id = cur.lastrowid
+            cur.executemany(
+                "INSERT OR IGNORE INTO bundle_features (feature, value, bundle_id) VALUES (?, ?, ?)",
+                [(key, val, bundle_id) for key, val in pairs]
+            )
+        found[pairs] = bundle_id
+        return bundle_id
+
+    def write(self, doc_id, annotated):
+        """
+        Сохраняет предложения документа doc_id.
+
+        annotated — [(sentence_text, [(token, lemma, pos, start, stop, feats), ...]), ...],
+        feats — последовательность пар (признак, значение).
+        Вызывающий код должен держать db.lock; запись выполняется одной транзакцией.
+        Возвращает количество записанных токенов.
+        """
+        with self.db.conn:
+            cur = self.db.conn.cursor()
+            sentence_id = self._next_id(cur, "sentences")
+            token_id = first_token_id = self._next_id(cur, "tokens")
+
+            sentence_rows = []
+            token_rows = []
+            lexicon = set()
+            found_bundles = {}
+            for sent_text, sent_tokens in annotated:
+                sentence_rows.append((sentence_id, doc_id, sent_text))
+                for position, (text, lemma, pos, start, stop, feats) in enumerate(sent_tokens):
+                    token_fold = text.casefold() if text is not None else None
+                    lemma_fold = lemma.casefold() if lemma is not None else None
+                    token_rows.append((
+                        token_id, sentence_id, text, lemma, pos, start, stop, position,
+                        self._bundle_id(cur, feats, found_bundles), token_fold, lemma_fold
+                    ))
+                    lexicon.add(('token', token_fold))
+                    lexicon.add(('lemma', lemma_fold))
+                    token_id += 1
+                sentence_id += 1
+
+            cur.executemany(
+                "INSERT INTO sentences (id, doc_id, sentence_text) VALUES (?, ?, ?)",
+                sentence_rows
+            )
+            cur.executemany(
+                "INSERT INTO tokens (id, sentence_id, token, lemma, pos, start, end, position, "
+                "bundle_id, token_fold, lemma_fold) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                token_rows
+            )
+            # Новые формы попадают и в триграммный индекс (триггер lexicon_ai)
+            cur.executemany(
+                "INSERT OR IGNORE INTO lexicon (kind, form) VALUES (?, ?)",
+                [entry for entry in lexicon if entry[1] is not None]
+            )
+            self.db.update_statistics(cur, "id BETWEEN ? AND ?", (first_token_id, token_id - 1))
+            self.db.update_frequencies(cur, "id BETWEEN ? AND ?", (first_token_id, token_id - 1))
+        self._bundle_ids.update(found_bundles)
+        self.db.bump_version(doc_id)
+        return len(token_rows)
+
+    def drop_indexes(self):
+        """Удаляет поисковые индексы tokens перед крупной пакетной загрузкой."""
+        with self.db.conn:
+            for name in self.db.TOKEN_INDEXES:
+                self.db.conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def create_indexes(self):
+        """Восстанавливает поисковые индексы tokens после пакетной загрузки."""
+        with self.db.conn:
+            for name, ddl in self.db.TOKEN_INDEXES.items():
+                self.db.conn.execute(ddl)
@@ -0,0 +1,118 @@
+import json
+import os
+import numpy as np
+
+# Версия формата снимка (manifest.json 'format')
+FORMAT_VERSION = 1
+# Столбцы токенов (int32, по одному значению на токен в порядке документ,
+# предложение, позиция): словоформа и лемма — номера в словаре форм,
+# часть речи и набор признаков — номера в списках manifest.json (-1 — нет
+# значения), sentence и doc — номера предложения и документа в снимке
+TOKEN_COLUMNS = ('token', 'lemma', 'pos', 'bundle', 'start', 'end', 'sentence', 'doc')
+# Строковые данные: байты UTF-8 подряд (.bin) и смещения (.offsets.npy)
+BLOBS = ('forms', 'sentence_text', 'document_text')
+
+
+class BlobWriter:
+    """Последовательная запись строк в .bin со смещениями (для BLOBS)."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._file = open(prefix + '.bin', 'wb', buffering=1 << 20)
+        self._offsets = [0]
+
+    def add(self, text):
+        data = (text or '').encode('utf-8')
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self):
+        self._file.close()
+        np.save(self.prefix + '.offsets.npy', np.array(self._offsets, dtype=np.int64))
+
+
+class _Blob:
+    def __init__(self, prefix):
+        self.offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        size = os.path.getsize(prefix + '.bin')
+        # np.memmap не открывает пустые файлы
+        self.data = np.memmap(prefix + '.bin', dtype=np.uint8, mode='r') if size else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+
+class CorpusSnapshot:
+    """
+    Колоночный снимок корпуса на диске (см. utils.snapshot_utils):
+
+    - manifest.json — версия формата, метаданные документов, списки частей
+      речи и наборов признаков;
+    - <столбец>.npy — столбцы токенов TOKEN_COLUMNS;
+    - sentence_offsets.npy — границы предложений в массивах токенов
+      (предложение i — токены offsets[i]:offsets[i + 1]), sentence_doc.npy —
+      документ предложения;
+    - forms / sentence_text / document_text — словарь форм (словоформы и
+      леммы) и тексты, строки UTF-8 со смещениями.
+
+    Все массивы открываются через mmap: открытие снимка не зависит от
+    размера корпуса, данные читаются с диска при обращении.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        manifest_path = os.path.join(path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"Снимок корпуса не найден: {path}")
+        with open(manifest_path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия снимка: {self.manifest.get('format')}")
+        self.documents = self.manifest['documents']
+        self.pos_tags = self.manifest['pos']
+        self.bundles = self.manifest['bundles']
+        self.columns = {
+            name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in TOKEN_COLUMNS
+        }
+        self.sentence_offsets = np.load(os.path.join(path, 'sentence_offsets.npy'), mmap_mode='r')
+        self.sentence_doc = np.load(os.path.join(path, 'sentence_doc.npy'), mmap_mode='r')
+        self.forms = _Blob(os.path.join(path, 'forms'))
+        self.sentence_texts = _Blob(os.path.join(path, 'sentence_text'))
+        self.document_texts = _Blob(os.path.join(path, 'document_text'))
+        self._form_ids = None
+
+    @property
+    def token_count(self):
+        return len(self.columns['token'])
+
+    @property
+    def sentence_count(self):
+        return len(self.sentence_offsets) - 1
+
+    def form_id(self, form):
+        """Номер формы в словаре или -1 (словарь в памяти строится при первом вызове)."""
+        if self._form_ids is None:
+            self._form_ids = {self.forms[i]: i for i in range(len(self.forms))}
+        return self._form_ids.get(form, -1)
+
+    def sentence(self, i):
+        """(текст, [(token, lemma, pos, start, end, bundle), ...]) предложения i."""
+        begin, stop = int(self.sentence_offsets[i]), int(self.sentence_offsets[i + 1])
+        cols = [self.columns[name][begin:stop].tolist() for name in TOKEN_COLUMNS[:6]]
+        tokens = [
+            (self.forms[token] if token >= 0 else None, self.forms[lemma] if lemma >= 0 else None,
+             self.pos_tags[pos] if pos >= 0 else None, start, end,
+             self.bundles[bundle] if bundle >= 0 else None)
+            for token, lemma, pos, bundle, start, end in zip(*cols)
+        ]
+        return self.sentence_texts[i], tokens
+
+    def lemma_tokens(self, lemma):
+        """Номера токенов с леммой lemma (точное совпадение) — один проход по столбцу."""
+        form = self.form_id(lemma)
+        if form < 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.columns['lemma'] == form)
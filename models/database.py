@@ -1,13 +1,113 @@
+import queue
 import sqlite3
+from contextlib import contextmanager
 from config import Config
-from threading import Lock
+from threading import Lock, local
 
 class Database:
+    # Индексы tokens, которые можно временно удалять при пакетной загрузке
+    TOKEN_INDEXES = {
+        'idx_lemma': 'CREATE INDEX IF NOT EXISTS idx_lemma ON tokens(lemma)',
+        'idx_pos': 'CREATE INDEX IF NOT EXISTS idx_pos ON tokens(pos)',
+        'idx_token': 'CREATE INDEX IF NOT EXISTS idx_token ON tokens(token)',
+        'idx_lemma_fold': 'CREATE INDEX IF NOT EXISTS idx_lemma_fold ON tokens(lemma_fold)',
+        'idx_token_fold': 'CREATE INDEX IF NOT EXISTS idx_token_fold ON tokens(token_fold)',
+    }
+    # Статистика value_stats: вид значения → столбец tokens
+    STATISTICS_COLUMNS = {
+        'lemma': 'lemma_fold',
+        'token': 'token_fold',
+        'pos': 'pos',
+        'bundle': 'bundle_id',
+    }
+
     def __init__(self):
-        self.conn = sqlite3.connect(Config.DB_PATH, check_same_thread=False)
+        # Единственное соединение для записи (под self.lock) и пул соединений
+        # только для чтения: в режиме WAL запросы не ждут завершения загрузки
+        self.conn = self._connect()
+        self.conn.execute("PRAGMA journal_mode=WAL")
         self.lock = Lock()
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._readers_lock = Lock()
+        self.has_trigram_index = False
+        # Растёт при каждом изменении корпуса; по нему устаревают кэши запросов
+        self.corpus_version = 0
+        # Обработчики изменения токенов документа: listener(doc_id)
+        self._change_listeners = []
+        # Проверка отмены запросов чтения текущего потока (см. set_cancel_check)
+        self._query_state = local()
         self.create_tables()
 
+    def _connect(self, readonly=False):
+        if readonly:
+            conn = sqlite3.connect(
+                f"file:{Config.DB_PATH}?mode=ro", uri=True, check_same_thread=False
+            )
+            conn.set_progress_handler(self._progress, Config.QUERY_PROGRESS_STEPS)
+        else:
+            conn = sqlite3.connect(Config.DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{Config.DB_CACHE_KB}")
+        conn.execute(f"PRAGMA mmap_size={Config.DB_MMAP_BYTES}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={Config.DB_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def set_cancel_check(self, check):
+        """
+        check() → True прерывает запросы чтения, выполняемые в текущем потоке
+        (sqlite3.OperationalError: interrupted); None — отключить проверку.
+        """
+        self._query_state.check = check
+
+    def _progress(self):
+        check = getattr(self._query_state, 'check', None)
+        return 1 if check is not None and check() else 0
+
+    def add_change_listener(self, listener):
+        """listener(doc_id) вызывается после каждой записи или удаления токенов документа."""
+        self._change_listeners.append(listener)
+
+    def bump_version(self, doc_id=None):
+        """
+        Отметить изменение корпуса (добавление, удаление, импорт).
+        doc_id — документ, токены которого изменились (для обработчиков изменений).
+        """
+        with self._readers_lock:
+            self.corpus_version += 1
+        if doc_id is not None:
+            for listener in self._change_listeners:
+                listener(doc_id)
+
+    @contextmanager
+    def reader(self):
+        """
+        Соединение только для чтения из пула (не более Config.READ_POOL_SIZE).
+        Используется для поиска и отображения вместо self.conn/self.lock.
+        Если все соединения пула заняты (долгие запросы каналов QueryExecutor),
+        открывается временное соединение: ожидание заблокировало бы поток
+        интерфейса.
+        """
+        pooled = True
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                pooled = self._reader_count < Config.READ_POOL_SIZE
+                if pooled:
+                    self._reader_count += 1
+            conn = self._connect(readonly=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if pooled:
+                self._readers.put(conn)
+            else:
+                conn.close()
+
     def create_tables(self):
         with self.lock, self.conn:
             self.conn.executescript('''
@@ -35,24 +135,317 @@ class Database:
                     pos TEXT,
                     start INTEGER,
                     end INTEGER,
-                    FOREIGN KEY(sentence_id) REFERENCES sentences(id)
+                    -- Порядковый номер токена в предложении (с 0)
+                    position INTEGER,
+                    bundle_id INTEGER,
+                    -- Формы в нижнем регистре (str.casefold) для поиска без учёта
+                    -- регистра по индексу: LOWER() в SQLite не понимает кириллицу
+                    token_fold TEXT,
+                    lemma_fold TEXT,
+                    FOREIGN KEY(sentence_id) REFERENCES sentences(id),
+                    FOREIGN KEY(bundle_id) REFERENCES feature_bundles(id)
+                );
+                -- Словарь наборов грамматических признаков: токен ссылается на
+                -- набор целиком ('Case=Gen|Number=Plur'), признаки набора
+                -- раскрыты в bundle_features для индексного поиска
+                CREATE TABLE IF NOT EXISTS feature_bundles (
+                    id INTEGER PRIMARY KEY,
+                    bundle TEXT UNIQUE
                 );
-                CREATE TABLE IF NOT EXISTS grammar_features (
-                    token_id INTEGER,
+                CREATE TABLE IF NOT EXISTS bundle_features (
                     feature TEXT,
                     value TEXT,
-                    FOREIGN KEY(token_id) REFERENCES tokens(id)
+                    bundle_id INTEGER,
+                    PRIMARY KEY(feature, value, bundle_id),
+                    FOREIGN KEY(bundle_id) REFERENCES feature_bundles(id)
+                ) WITHOUT ROWID;
+            ''')
+            self._migrate_grammar_features()
+            self._migrate_case_folding()
+            self._migrate_positions()
+            self.conn.executescript('''
+                CREATE INDEX IF NOT EXISTS idx_bundle ON tokens(bundle_id);
+                CREATE INDEX IF NOT EXISTS idx_sentence_position ON tokens(sentence_id, position);
+                CREATE INDEX IF NOT EXISTS idx_sentences_doc ON sentences(doc_id);
+                CREATE INDEX IF NOT EXISTS idx_bundle_features ON bundle_features(bundle_id);
+                -- Прежнее построчное представление признаков для чтения
+                CREATE VIEW IF NOT EXISTS grammar_features AS
+                    SELECT t.id AS token_id, bf.feature, bf.value
+                    FROM tokens t
+                    JOIN bundle_features bf ON bf.bundle_id = t.bundle_id;
+            ''')
+            for ddl in self.TOKEN_INDEXES.values():
+                self.conn.execute(ddl)
+            self._create_lexicon()
+            self._create_statistics()
+            self._create_frequencies()
+
+    def _create_lexicon(self):
+        """
+        Словарь различных лемм и словоформ (в нижнем регистре) с триграммным
+        индексом FTS5 для поиска по подстроке. Словарь на порядки меньше
+        tokens, найденные формы соединяются с tokens по idx_*_fold.
+        """
+        existed = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'lexicon'"
+        ).fetchone() is not None
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS lexicon (
+                id INTEGER PRIMARY KEY,
+                kind TEXT,
+                form TEXT,
+                UNIQUE(kind, form)
+            )
+        ''')
+        try:
+            self.conn.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS lexicon_trigrams USING fts5(
+                    form, content='lexicon', content_rowid='id', tokenize='trigram'
                 );
-                CREATE INDEX IF NOT EXISTS idx_lemma ON tokens(lemma);
-                CREATE INDEX IF NOT EXISTS idx_pos ON tokens(pos);
-                CREATE INDEX IF NOT EXISTS idx_token ON tokens(token);
-                CREATE INDEX IF NOT EXISTS idx_token_id ON grammar_features(token_id);
-                CREATE INDEX IF NOT EXISTS idx_grammar_feature ON grammar_features(feature, value);
+                CREATE TRIGGER IF NOT EXISTS lexicon_ai AFTER INSERT ON lexicon BEGIN
+                    INSERT INTO lexicon_trigrams (rowid, form) VALUES (new.id, new.form);
+                END;
             ''')
+            self.has_trigram_index = True
+        except sqlite3.OperationalError:
+            # SQLite без FTS5/trigram: подстрока ищется перебором словаря
+            self.has_trigram_index = False
+        if not existed:
+            with self.conn:
+                self.conn.executescript('''
+                    INSERT OR IGNORE INTO lexicon (kind, form)
+                        SELECT DISTINCT 'lemma', lemma_fold FROM tokens WHERE lemma_fold IS NOT NULL;
+                    INSERT OR IGNORE INTO lexicon (kind, form)
+                        SELECT DISTINCT 'token', token_fold FROM tokens WHERE token_fold IS NOT NULL;
+                ''')
 
-    def get_processing_stats(self):
+    def _create_statistics(self):
+        """
+        Число токенов для каждого значения леммы, словоформы (в нижнем регистре),
+        части речи и набора признаков — оценки селективности для планировщика
+        запросов. Поддерживается при записи и удалении (update_statistics).
+        """
+        existed = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'value_stats'"
+        ).fetchone() is not None
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS value_stats (
+                kind TEXT,
+                -- форма, код части речи или id набора признаков
+                value,
+                count INTEGER,
+                PRIMARY KEY(kind, value)
+            ) WITHOUT ROWID
+        ''')
+        if not existed:
+            self.rebuild_statistics()
+
+    def update_statistics(self, cur, token_filter, params=(), sign=1):
+        """
+        Прибавляет (sign=1) или вычитает (sign=-1) из value_stats счётчики
+        токенов, отобранных условием token_filter по tokens.
+        Выполняется в транзакции записи вызывающего кода.
+        """
+        for kind, column in self.STATISTICS_COLUMNS.items():
+            cur.execute(f'''
+                INSERT INTO value_stats (kind, value, count)
+                SELECT ?, {column}, ? * COUNT(*) FROM tokens
+                WHERE ({token_filter}) AND {column} IS NOT NULL
+                GROUP BY {column}
+                ON CONFLICT(kind, value) DO UPDATE SET count = count + excluded.count
+            ''', (kind, sign, *params))
+        if sign < 0:
+            cur.execute("DELETE FROM value_stats WHERE count <= 0")
+
+    def rebuild_statistics(self):
+        """Полный пересчёт value_stats и статистики индексов SQLite (ANALYZE)."""
+        with self.conn:
+            cur = self.conn.cursor()
+            cur.execute("DELETE FROM value_stats")
+            self.update_statistics(cur, "1")
+        self.conn.execute("ANALYZE")
+
+    def _create_frequencies(self):
+        """
+        Частотные таблицы: число токенов по (лемма, часть речи, документ) и по
+        (словоформа, лемма, часть речи, документ) — по ним частотные списки,
+        сводка поиска и число вхождений считаются без агрегации tokens.
+        Поддерживаются в транзакциях записи и удаления (update_frequencies).
+        Пустая строка вместо NULL: NULL в первичном ключе не совпадает сам с собой.
+        """
+        existed = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'form_frequencies'"
+        ).fetchone() is not None
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS lemma_frequencies (
+                lemma_fold TEXT,
+                pos TEXT,
+                doc_id INTEGER,
+                count INTEGER,
+                PRIMARY KEY(lemma_fold, pos, doc_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS form_frequencies (
+                token TEXT,
+                lemma TEXT,
+                pos TEXT,
+                doc_id INTEGER,
+                token_fold TEXT,
+                lemma_fold TEXT,
+                count INTEGER,
+                PRIMARY KEY(token, lemma, pos, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_form_frequencies_token ON form_frequencies(token_fold);
+            CREATE INDEX IF NOT EXISTS idx_form_frequencies_lemma ON form_frequencies(lemma_fold);
+            CREATE INDEX IF NOT EXISTS idx_form_frequencies_doc ON form_frequencies(doc_id);
+        ''')
+        if not existed:
+            self.rebuild_frequencies()
+
+    def update_frequencies(self, cur, token_filter, params=(), sign=1):
+        """
+        Прибавляет (sign=1) или вычитает (sign=-1) из частотных таблиц токены,
+        отобранные условием token_filter по tokens.
+        Выполняется в транзакции записи вызывающего кода.
+        """
+        tokens = f"(SELECT * FROM tokens WHERE {token_filter})"
+        cur.execute(f'''
+            INSERT INTO lemma_frequencies (lemma_fold, pos, doc_id, count)
+            SELECT IFNULL(t.lemma_fold, ''), IFNULL(t.pos, ''), s.doc_id, ? * COUNT(*)
+            FROM {tokens} t JOIN sentences s ON s.id = t.sentence_id
+            WHERE 1
+            GROUP BY 1, 2, 3
+            ON CONFLICT(lemma_fold, pos, doc_id) DO UPDATE SET count = count + excluded.count
+        ''', (sign, *params))
+        cur.execute(f'''
+            INSERT INTO form_frequencies (token, lemma, pos, doc_id, token_fold, lemma_fold, count)
+            SELECT IFNULL(t.token, ''), IFNULL(t.lemma, ''), IFNULL(t.pos, ''), s.doc_id,
+                   IFNULL(t.token_fold, ''), IFNULL(t.lemma_fold, ''), ? * COUNT(*)
+            FROM {tokens} t JOIN sentences s ON s.id = t.sentence_id
+            WHERE 1
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT(token, lemma, pos, doc_id) DO UPDATE SET count = count + excluded.count
+        ''', (sign, *params))
+        if sign < 0:
+            cur.execute("DELETE FROM lemma_frequencies WHERE count <= 0")
+            cur.execute("DELETE FROM form_frequencies WHERE count <= 0")
+
+    def rebuild_frequencies(self):
+        """Полный пересчёт частотных таблиц по tokens."""
+        with self.conn:
+            cur = self.conn.cursor()
+            cur.execute("DELETE FROM lemma_frequencies")
+            cur.execute("DELETE FROM form_frequencies")
+            self.update_frequencies(cur, "1")
+
+    def _columns(self, table):
+        return {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+
+    def _migrate_grammar_features(self):
+        """
+        Перевод базы старого формата (таблица grammar_features со строкой на
+        каждый признак) на наборы признаков: tokens.bundle_id + feature_bundles.
+        """
+        if 'bundle_id' not in self._columns('tokens'):
+            self.conn.execute("ALTER TABLE tokens ADD COLUMN bundle_id INTEGER")
+        row = self.conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'grammar_features'"
+        ).fetchone()
+        if not row or row[0] != 'table':
+            return
+
+        # Набор признаков каждого токена одной строкой (признаки по алфавиту);
+        # миграция выполняется одной транзакцией
+        self.conn.executescript('''
+            BEGIN;
+            CREATE TEMP TABLE token_bundles (token_id INTEGER PRIMARY KEY, bundle TEXT);
+            INSERT INTO token_bundles
+                SELECT token_id, group_concat(feature || '=' || value, '|')
+                FROM (SELECT token_id, feature, value FROM grammar_features
+                      ORDER BY token_id, feature, value)
+                GROUP BY token_id;
+            INSERT OR IGNORE INTO feature_bundles (bundle)
+                SELECT DISTINCT bundle FROM token_bundles;
+            UPDATE tokens SET bundle_id = (
+                SELECT fb.id FROM token_bundles tb
+                JOIN feature_bundles fb ON fb.bundle = tb.bundle
+                WHERE tb.token_id = tokens.id
+            )
+            WHERE id IN (SELECT token_id FROM token_bundles);
+            -- Признаки набора берутся у одного представителя
+            INSERT OR IGNORE INTO bundle_features (feature, value, bundle_id)
+                SELECT gf.feature, gf.value, fb.id
+                FROM (SELECT bundle, MIN(token_id) AS token_id
+                      FROM token_bundles GROUP BY bundle) r
+                JOIN feature_bundles fb ON fb.bundle = r.bundle
+                JOIN grammar_features gf ON gf.token_id = r.token_id;
+            DROP TABLE temp.token_bundles;
+            DROP TABLE grammar_features;
+            COMMIT;
+        ''')
+
+    def _migrate_case_folding(self):
+        """Добавляет и заполняет token_fold/lemma_fold в базах старого формата."""
+        if 'token_fold' in self._columns('tokens'):
+            return
+        self.conn.create_function(
+            'casefold', 1, lambda s: s.casefold() if s is not None else None,
+            deterministic=True
+        )
+        self.conn.executescript('''
+            BEGIN;
+            ALTER TABLE tokens ADD COLUMN token_fold TEXT;
+            ALTER TABLE tokens ADD COLUMN lemma_fold TEXT;
+            UPDATE tokens SET token_fold = casefold(token), lemma_fold = casefold(lemma);
+            COMMIT;
+        ''')
+
+    def _migrate_positions(self):
+        """Добавляет и заполняет tokens.position в базах старого формата."""
+        if 'position' in self._columns('tokens'):
+            return
+        self.conn.executescript('''
+            BEGIN;
+            ALTER TABLE tokens ADD COLUMN position INTEGER;
+            UPDATE tokens SET position = p.position
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY sentence_id ORDER BY start, id) - 1 AS position
+                FROM tokens
+            ) AS p
+            WHERE tokens.id = p.id;
+            COMMIT;
+        ''')
+
+    def add_document(self, title, author, date, genre, text='', processing_time=None, page_count=None):
+        """Добавляет документ без аннотаций; None, если документ с таким названием уже есть."""
+        with self.lock, self.conn:
+            if self.conn.execute("SELECT 1 FROM documents WHERE title = ?", (title,)).fetchone():
+                return None
+            cur = self.conn.execute(
+                "INSERT INTO documents (title, author, date, genre, text, processing_time, page_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (title, author, date, genre, text, processing_time, page_count)
+            )
+        self.bump_version()
+        return cur.lastrowid
+
+    def delete_document(self, doc_id):
+        """
+        Удаляет документ с предложениями и токенами одной транзакцией,
+        вычитая его токены из статистики и частотных таблиц.
+        """
+        token_filter = "sentence_id IN (SELECT id FROM sentences WHERE doc_id = ?)"
         with self.lock, self.conn:
             cur = self.conn.cursor()
+            self.update_statistics(cur, token_filter, (doc_id,), sign=-1)
+            self.update_frequencies(cur, token_filter, (doc_id,), sign=-1)
+            cur.execute(f"DELETE FROM tokens WHERE {token_filter}", (doc_id,))
+            cur.execute("DELETE FROM sentences WHERE doc_id = ?", (doc_id,))
+            cur.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        self.bump_version(doc_id)
+
+    def get_processing_stats(self):
+        with self.reader() as conn:
+            cur = conn.cursor()
             cur.execute('''
                 SELECT id, title, processing_time, page_count 
                 FROM documents 
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from threading import Lock
+from config import Config
+
+# Версия формата сериализованных аннотаций
+FORMAT_VERSION = 3
+
+
+class _EntryWriter:
+    """
+    Потоковая запись в кэш: аннотации добавляются порциями и сразу
+    сжимаются (строка JSON на порцию), в памяти — только сжатые байты.
+    Последняя строка — [text, page_count, processing_time].
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        self._compressor = zlib.compressobj()
+        self._parts = []
+
+    def _write(self, value):
+        data = self._compressor.compress(json.dumps(value, ensure_ascii=False).encode('utf-8') + b'\n')
+        if data:
+            self._parts.append(data)
+            self.size += len(data)
+
+    def add(self, annotated):
+        """Добавляет порцию аннотированных предложений."""
+        self._write(annotated)
+
+    def finish(self, text, page_count, processing_time):
+        """Сохраняет запись; слишком большая (больше max_bytes) не сохраняется."""
+        self._write([text, page_count, processing_time])
+        self._parts.append(self._compressor.flush())
+        self.cache._store(self.key, b''.join(self._parts))
+
+
+class IngestCache:
+    """
+    Кэш результатов разбора, адресуемый по содержимому: ключ — хэш файла и
+    версия NLP-модели, значение — текст, число страниц, исходное время
+    обработки и аннотации предложений.
+    Размер ограничен max_bytes, при переполнении удаляются давно не
+    использованные записи.
+    """
+
+    def __init__(self, model_version, path=None, max_bytes=None):
+        self.model_version = model_version
+        self.max_bytes = max_bytes or Config.CACHE_MAX_BYTES
+        self.conn = sqlite3.connect(path or Config.CACHE_PATH, check_same_thread=False)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        with self.lock, self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS ingest_cache (
+                    key TEXT PRIMARY KEY,
+                    payload BLOB,
+                    size INTEGER,
+                    last_used REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_cache_last_used ON ingest_cache(last_used);
+            ''')
+
+    @staticmethod
+    def file_hash(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def key_for(self, file_path):
+        return f"{self.file_hash(file_path)}:{self.model_version}:{FORMAT_VERSION}"
+
+    def get(self, key):
+        """Возвращает (text, page_count, processing_time, annotated) или None."""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT payload FROM ingest_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE ingest_cache SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+        # JSON экранирует '\n', но не U+2028 и т. п., поэтому не splitlines()
+        lines = zlib.decompress(row[0]).decode('utf-8').rstrip('\n').split('\n')
+        text, page_count, processing_time = json.loads(lines[-1])
+        annotated = [sentence for line in lines[:-1] for sentence in json.loads(line)]
+        return text, page_count, processing_time, annotated
+
+    def writer(self, key):
+        """Запись для key, заполняемая порциями аннотаций (см. _EntryWriter)."""
+        return _EntryWriter(self, key)
+
+    def put(self, key, text, page_count, processing_time, annotated):
+        entry = self.writer(key)
+        entry.add(annotated)
+        entry.finish(text, page_count, processing_time)
+
+    def _store(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ingest_cache (key, payload, size, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ingest_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        cur = self.conn.execute("SELECT key, size FROM ingest_cache ORDER BY last_used")
+        stale = []
+        for key, size in cur:
+            stale.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self.conn.executemany("DELETE FROM ingest_cache WHERE key = ?", stale)
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ingest_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
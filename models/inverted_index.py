@@ -0,0 +1,311 @@
+import json
+import os
+from threading import Lock
+import numpy as np
+from config import Config
+
+# Столбцы postings: документ, предложение, токен (токены предложения идут по возрастанию id)
+DOC, SENTENCE, TOKEN = 0, 1, 2
+KINDS = {'lemma': 't.lemma_fold', 'token': 't.token_fold'}
+
+
+class _Segment:
+    """
+    Неизменяемый сегмент индекса для одного вида ключей: отсортированные ключи,
+    смещения и массив postings (doc_id, sentence_id, token_id), все файлы .npy
+    открываются через mmap.
+    """
+
+    def __init__(self, prefix):
+        self.keys = np.load(prefix + '.keys.npy', mmap_mode='r')
+        self.offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        self.postings = np.load(prefix + '.postings.npy', mmap_mode='r')
+
+    def lookup(self, key):
+        pos = int(np.searchsorted(self.keys, key))
+        if pos >= len(self.keys) or self.keys[pos] != key:
+            return None
+        return self.postings[self.offsets[pos]:self.offsets[pos + 1]]
+
+
+def _write_segment(prefix, rows, count):
+    """
+    Записывает сегмент из итератора (key, doc_id, sentence_id, token_id),
+    упорядоченного по (key, doc_id, sentence_id, token_id); count — число строк.
+    """
+    postings = np.lib.format.open_memmap(
+        prefix + '.postings.npy', mode='w+', dtype=np.int64, shape=(count, 3)
+    )
+    keys = []
+    offsets = []
+    batch = []
+    filled = 0
+    for key, doc_id, sentence_id, token_id in rows:
+        if not keys or keys[-1] != key:
+            keys.append(key)
+            offsets.append(filled + len(batch))
+        batch.append((doc_id, sentence_id, token_id))
+        if len(batch) >= 100_000:
+            postings[filled:filled + len(batch)] = batch
+            filled += len(batch)
+            batch = []
+    if batch:
+        postings[filled:filled + len(batch)] = batch
+        filled += len(batch)
+    postings.flush()
+    del postings
+    offsets.append(filled)
+    np.save(prefix + '.keys.npy', np.array(keys, dtype=str) if keys else np.array([], dtype='<U1'))
+    np.save(prefix + '.offsets.npy', np.array(offsets, dtype=np.int64))
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс на диске: лемма/словоформа (в нижнем регистре) →
+    отсортированные вхождения (doc_id, sentence_id, token_id).
+
+    Индекс состоит из сегментов: полная сборка даёт базовый сегмент, каждый
+    добавленный документ — ещё один, удалённые документы отмечаются в
+    manifest.json и отфильтровываются при чтении. При числе сегментов больше
+    Config.INDEX_MAX_SEGMENTS сегменты документов сливаются в один, а когда
+    они перерастают базовый — индекс пересобирается целиком.
+
+    Каждая запись токенов в базу (Database.bump_version с doc_id) отмечает
+    документ как ожидающий; пока такие есть, lookup возвращает None (поиск
+    идёт через SQL), а manifest.json сохраняется без отпечатка tokens, т. е.
+    после перезапуска индекс считается устаревшим до пересборки.
+
+    Загрузка, которая сама добавит документ в индекс, отмечает его через
+    begin_document до записи токенов: полная сборка такие документы
+    пропускает и оставляет ожидающими, иначе их токены попали бы и в базовый
+    сегмент, и в сегмент документа.
+    """
+
+    def __init__(self, db, path=None):
+        self.db = db
+        self.path = path or Config.INDEX_DIR
+        self._lock = Lock()
+        self._manifest = None
+        self._segments = {kind: [] for kind in KINDS}
+        self._deleted = np.array([], dtype=np.int64)
+        # Документы, изменённые в базе, но ещё не отражённые в индексе
+        self._pending = set()
+        # Документы, токены которых ещё записываются (begin_document)
+        self._writing = set()
+        self._pending_lock = Lock()
+        db.add_change_listener(self._on_change)
+        self.open()
+
+    @property
+    def available(self):
+        return self._manifest is not None
+
+    @property
+    def current(self):
+        """Индекс открыт и отражает все записи в базу."""
+        return self._manifest is not None and not self._pending
+
+    def _on_change(self, doc_id):
+        with self._pending_lock:
+            self._pending.add(int(doc_id))
+
+    def _done(self, doc_id):
+        with self._pending_lock:
+            self._pending.discard(doc_id)
+            self._writing.discard(doc_id)
+
+    def begin_document(self, doc_id):
+        """
+        Отмечает документ, токены которого сейчас записываются; вызывается
+        после вставки в documents и до первой записи токенов. Отметку снимают
+        add_document или delete_document.
+        """
+        with self._pending_lock:
+            self._pending.add(int(doc_id))
+            self._writing.add(int(doc_id))
+
+    def _manifest_path(self):
+        return os.path.join(self.path, 'manifest.json')
+
+    def _stamp(self):
+        """Отпечаток состояния tokens для проверки актуальности индекса."""
+        with self.db.reader() as conn:
+            return list(conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM tokens").fetchone())
+
+    def open(self):
+        """Открывает индекс, если он есть и соответствует базе; иначе индекс не используется."""
+        self._manifest = None
+        if not os.path.exists(self._manifest_path()):
+            return False
+        with open(self._manifest_path(), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('stamp') is None or manifest['stamp'] != self._stamp():
+            return False
+        self._load(manifest)
+        return True
+
+    def _load(self, manifest):
+        segments = {
+            kind: [_Segment(os.path.join(self.path, f"{name}.{kind}")) for name in manifest['segments']]
+            for kind in KINDS
+        }
+        self._segments = segments
+        self._deleted = np.array(sorted(manifest['deleted_docs']), dtype=np.int64)
+        self._manifest = manifest
+
+    def _save(self, manifest):
+        # Отпечаток подтверждает актуальность, только если ничего не ожидает индексации
+        manifest['stamp'] = self._stamp() if not self._pending else None
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+        self._load(manifest)
+
+    def _write_segments(self, conn, name, doc_ids=None, exclude=()):
+        """
+        Сегменты всех видов ключей в одной транзакции чтения conn: вхождения
+        документов doc_ids (None — всех), кроме документов exclude.
+        """
+        where, params = "", []
+        if doc_ids is not None:
+            where += " AND s.doc_id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(doc_ids))
+        if exclude:
+            where += " AND s.doc_id NOT IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(sorted(exclude)))
+        for kind, column in KINDS.items():
+            count = conn.execute(f'''
+                SELECT COUNT(*) FROM tokens t JOIN sentences s ON t.sentence_id = s.id
+                WHERE {column} IS NOT NULL{where}
+            ''', params).fetchone()[0]
+            rows = conn.execute(f'''
+                SELECT {column}, s.doc_id, t.sentence_id, t.id
+                FROM tokens t JOIN sentences s ON t.sentence_id = s.id
+                WHERE {column} IS NOT NULL{where}
+                ORDER BY {column}, s.doc_id, t.sentence_id, t.id
+            ''', params)
+            _write_segment(os.path.join(self.path, f"{name}.{kind}"), rows, count)
+
+    def _remove_files(self, names):
+        for name in names:
+            for kind in KINDS:
+                for part in ('keys', 'offsets', 'postings'):
+                    file_path = os.path.join(self.path, f"{name}.{kind}.{part}.npy")
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+
+    def _build(self):
+        """Полная сборка (под self._lock): новый манифест с одним базовым сегментом."""
+        os.makedirs(self.path, exist_ok=True)
+        generation = (self._manifest['generation'] + 1) if self._manifest else 0
+        name = f"base{generation}"
+        # Законченные изменения войдут в сборку; записанные после начала
+        # чтения снова попадут в _pending
+        with self._pending_lock:
+            self._pending &= self._writing
+        with self.db.reader() as conn:
+            conn.execute("BEGIN")
+            max_doc = conn.execute("SELECT COALESCE(MAX(id), 0) FROM documents").fetchone()[0]
+            # Снимок чтения уже зафиксирован: токены, видимые в нём, записаны
+            # после begin_document, так что их документы есть в _writing.
+            # Их снимет только add_document/delete_document под self._lock
+            with self._pending_lock:
+                writing = set(self._writing)
+            self._write_segments(conn, name, exclude=writing)
+        return {
+            'generation': generation, 'segments': [name], 'docs': {},
+            'deleted_docs': [], 'max_doc': max_doc,
+        }
+
+    def build(self):
+        """Полная сборка индекса из таблицы tokens (один сегмент)."""
+        with self._lock:
+            old = self._manifest['segments'] if self._manifest else []
+            manifest = self._build()
+            self._save(manifest)
+            self._remove_files(n for n in old if n not in manifest['segments'])
+
+    def _compact(self, manifest):
+        """
+        Слияние сегментов документов (все, кроме базового) в один, заново
+        из таблицы tokens по их doc_id; если они вместе не меньше базового
+        сегмента — полная сборка. Так каждый токен переписывается
+        O(log N) раз, а не при каждом добавлении.
+        """
+        base, small = manifest['segments'][0], manifest['segments'][1:]
+        sizes = {
+            name: len(np.load(os.path.join(self.path, f"{name}.token.postings.npy"), mmap_mode='r'))
+            for name in manifest['segments']
+        }
+        if sum(sizes[name] for name in small) >= sizes[base]:
+            return self._build()
+        # В манифестах прежнего вида нет 'docs': id документа — в имени сегмента
+        docs = manifest.get('docs', {})
+        doc_ids = sorted({doc_id for name in small for doc_id in (docs[name] if name in docs else [int(name[3:])])})
+        generation = manifest['generation'] + 1
+        name = f"merged{generation}"
+        with self.db.reader() as conn:
+            conn.execute("BEGIN")
+            self._write_segments(conn, name, doc_ids)
+        return dict(manifest, generation=generation, segments=[base, name], docs={name: doc_ids})
+
+    def add_document(self, doc_id):
+        """Добавляет сегмент с вхождениями нового документа."""
+        doc_id = int(doc_id)
+        # Отметка снимается под self._lock: идущая сборка ещё считает документ незаписанным
+        with self._lock:
+            self._done(doc_id)
+            if not self.available:
+                return
+            old = self._manifest['segments']
+            # id удалённого документа может быть выдан заново: старые вхождения
+            # с тем же doc_id в сегментах не отличить от новых, поэтому пересборка
+            if doc_id in self._manifest['deleted_docs']:
+                manifest = self._build()
+                self._save(manifest)
+                self._remove_files(n for n in old if n not in manifest['segments'])
+                return
+            name = f"doc{doc_id}"
+            with self.db.reader() as conn:
+                conn.execute("BEGIN")
+                self._write_segments(conn, name, [doc_id])
+            manifest = dict(self._manifest)
+            manifest['segments'] = old + [name]
+            manifest['docs'] = dict(manifest.get('docs', {}), **{name: [doc_id]})
+            manifest['max_doc'] = max(manifest.get('max_doc', 0), doc_id)
+            if len(manifest['segments']) > Config.INDEX_MAX_SEGMENTS:
+                manifest = self._compact(manifest)
+            self._save(manifest)
+            self._remove_files(n for n in old + [name] if n not in manifest['segments'])
+
+    def delete_document(self, doc_id):
+        """Отмечает документ удалённым; его вхождения отбрасываются при чтении."""
+        doc_id = int(doc_id)
+        with self._lock:
+            self._done(doc_id)
+            if not self.available:
+                return
+            manifest = dict(self._manifest)
+            # Документ, так и не попавший в индекс (прерванная загрузка), не отмечается
+            if doc_id <= manifest.get('max_doc', doc_id):
+                manifest['deleted_docs'] = sorted(set(manifest['deleted_docs']) | {doc_id})
+            self._save(manifest)
+
+    def lookup(self, kind, key):
+        """
+        Вхождения ключа (lemma_fold или token_fold) — массив строк
+        (doc_id, sentence_id, token_id) по возрастанию; None, если индекс
+        не открыт или отстаёт от базы.
+        """
+        if not self.current:
+            return None
+        parts = [p for p in (seg.lookup(key) for seg in self._segments[kind]) if p is not None]
+        if not parts:
+            return np.empty((0, 3), dtype=np.int64)
+        postings = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        if len(self._deleted):
+            postings = postings[~np.isin(postings[:, DOC], self._deleted)]
+        if len(parts) > 1:
+            postings = postings[np.lexsort((postings[:, TOKEN], postings[:, SENTENCE], postings[:, DOC]))]
+        return postings
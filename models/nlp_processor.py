@@ -1,17 +1,157 @@
-from natasha import (
-    Segmenter, MorphVocab, NewsEmbedding,
-    NewsMorphTagger, Doc
-)
+import time
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from threading import Lock, Thread
+from config import Config
+
+try:
+    MODEL_VERSION = f"natasha-{version('natasha')}"
+except PackageNotFoundError:
+    MODEL_VERSION = "natasha-unknown"
 
 class NLPProcessor:
+    """
+    Морфологический разбор на natasha. Модели загружаются лениво — при первом
+    разборе или заранее в фоновом потоке через preload(), чтобы не задерживать
+    запуск интерфейса.
+    """
+
     def __init__(self):
-        self.segmenter = Segmenter()
-        self.morph_vocab = MorphVocab()
-        emb = NewsEmbedding()
-        self.morph_tagger = NewsMorphTagger(emb)
+        self._models = None
+        self._models_lock = Lock()
+        self.load_time = None
+        # Русский текст сильно повторяется: одинаковые (слово, pos, признаки)
+        # встречаются тысячи раз, поэтому лемматизация и кодирование признаков кэшируются
+        self._lemmatize = lru_cache(maxsize=Config.LEMMA_CACHE_SIZE)(self._lemmatize_uncached)
+        self._encode_feats = lru_cache(maxsize=Config.LEMMA_CACHE_SIZE)(_encode_feats)
+
+    def load(self):
+        """Загружает модели natasha (однократно, потокобезопасно)."""
+        if self._models is not None:
+            return self._models
+        with self._models_lock:
+            if self._models is None:
+                start = time.perf_counter()
+                from natasha import Segmenter, MorphVocab, NewsEmbedding, NewsMorphTagger, Doc
+                self._models = {
+                    'segmenter': Segmenter(),
+                    'morph_vocab': MorphVocab(),
+                    'morph_tagger': NewsMorphTagger(NewsEmbedding()),
+                    'doc': Doc,
+                }
+                self.load_time = time.perf_counter() - start
+        return self._models
+
+    def preload(self):
+        """Запускает загрузку моделей в фоновом потоке."""
+        Thread(target=self.load, daemon=True).start()
+
+    @property
+    def is_loaded(self):
+        return self._models is not None
+
+    @property
+    def segmenter(self):
+        return self.load()['segmenter']
+
+    @property
+    def morph_vocab(self):
+        return self.load()['morph_vocab']
+
+    @property
+    def morph_tagger(self):
+        return self.load()['morph_tagger']
+
+    def _lemmatize_uncached(self, text, pos, feats):
+        return self.morph_vocab.lemmatize(text, pos, dict(feats))
+
+    def cache_stats(self):
+        """Статистика кэшей лемматизации и кодирования признаков."""
+        stats = {}
+        for name, cached in (('lemma', self._lemmatize), ('feats', self._encode_feats)):
+            info = cached.cache_info()
+            lookups = info.hits + info.misses
+            stats[name] = {
+                'hits': info.hits,
+                'misses': info.misses,
+                'hit_ratio': info.hits / lookups if lookups else 0.0,
+                'size': info.currsize,
+            }
+        return stats
 
     def process(self, text):
-        doc = Doc(text)
+        doc = self.load()['doc'](text)
         doc.segment(self.segmenter)
         doc.tag_morph(self.morph_tagger)
-        return doc
\ No newline at end of file
+        return doc
+
+    def annotate(self, text, offset=0):
+        """
+        Разбор текста в виде простых структур, которые можно передавать
+        между процессами: [(sentence_text, [(token, lemma, pos, start, stop, feats), ...]), ...],
+        где feats — отсортированный кортеж пар (признак, значение).
+        offset прибавляется к позициям токенов (смещение фрагмента в документе).
+        """
+        doc = self.process(text)
+        sentences = []
+        for sent in doc.sents:
+            tokens = []
+            for token in sent.tokens:
+                feats = self._encode_feats(tuple((token.feats or {}).items()))
+                tokens.append((
+                    token.text,
+                    self._lemmatize(token.text, token.pos, feats),
+                    token.pos,
+                    token.start + offset,
+                    token.stop + offset,
+                    feats
+                ))
+            sentences.append((sent.text, tokens))
+        return sentences
+
+    def annotate_stream(self, pieces, chunk_size=Config.NLP_CHUNK_SIZE):
+        """
+        Потоковый разбор: текст (строка или итерируемое фрагментов) режется на
+        куски около chunk_size символов по границам абзацев/предложений,
+        для каждого куска выдаётся список предложений в формате annotate()
+        с позициями токенов относительно начала всего документа.
+        """
+        for offset, chunk in iter_chunks(pieces, chunk_size):
+            yield self.annotate(chunk, offset)
+
+
+def _encode_feats(pairs):
+    """Канонический (отсортированный) набор признаков; одинаковые наборы разделяют один кортеж."""
+    return tuple(sorted(pairs))
+
+
+# Разделители в порядке предпочтения: абзац, строка, конец предложения, пробел
+_CHUNK_SEPARATORS = ('\n\n', '\n', '. ', '! ', '? ', ' ')
+
+
+def _find_cut(buffer, chunk_size):
+    for sep in _CHUNK_SEPARATORS:
+        pos = buffer.rfind(sep, 0, chunk_size)
+        if pos > 0:
+            return pos + len(sep)
+    return chunk_size
+
+
+def iter_chunks(pieces, chunk_size=Config.NLP_CHUNK_SIZE):
+    """
+    Склеивает фрагменты текста и выдаёт пары (offset, chunk), где chunk
+    заканчивается на безопасной границе, а offset — его смещение в документе.
+    """
+    if isinstance(pieces, str):
+        pieces = (pieces,)
+    buffer = ''
+    offset = 0
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_size:
+            cut = _find_cut(buffer, chunk_size)
+            yield offset, buffer[:cut]
+            offset += cut
+            buffer = buffer[cut:]
+    if buffer:
+        yield offset, buffer
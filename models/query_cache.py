@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from threading import Lock
+from config import Config
+
+
+class QueryCache:
+    """
+    LRU-кэш результатов запросов (поиск, конкорданс, грамматика) в памяти.
+
+    Каждая запись помечена версией корпуса (Database.corpus_version), с
+    которой она вычислена; после добавления, удаления или импорта документов
+    версия меняется и старые записи считаются промахами.
+    """
+
+    def __init__(self, max_entries=None):
+        # max_entries=0 — кэш отключён (только статистика промахов)
+        self.max_entries = Config.QUERY_CACHE_SIZE if max_entries is None else max_entries
+        self._entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, key, version):
+        """Возвращает (True, значение) или (False, None)."""
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if entry[0] != version:
+                del self._entries[key]
+                self.misses += 1
+                self.stale += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key, version, value):
+        with self.lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self.lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'stale': self.stale,
+            'entries': entries,
+        }
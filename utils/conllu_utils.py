@@ -0,0 +1,299 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from models.bulk_writer import BulkWriter
+from utils.export_utils import RowCounter, stream_export
+
+# Метаданные документа в комментариях после '# newdoc'
+_DOC_FIELDS = ('title', 'author', 'date', 'genre')
+
+
+def _field(value):
+    """Значение столбца CoNLL-U: '_' для пустых, без табуляций и переводов строк."""
+    if value is None or value == '':
+        return '_'
+    return ' '.join(str(value).split()) or '_'
+
+
+def _comment(value):
+    """Значение комментария в одну строку (длина текста сохраняется)."""
+    if value is None:
+        return ''
+    return str(value).replace('\r', ' ').replace('\n', ' ').replace('\t', ' ')
+
+
+def _write_document(out, conn, document_id: int, counter: RowCounter):
+    """
+    Записывает документ в out: '# newdoc' с метаданными в комментариях,
+    затем предложения ('# sent_id', '# text') и токены одним упорядоченным
+    запросом, как в xml_utils. FEATS — строка набора признаков, смещения
+    токенов в документе — TokenRange=start:end в MISC. Предложения без
+    токенов пропускаются: в CoNLL-U их не записать.
+    """
+    meta = conn.execute(
+        "SELECT title, author, date, genre FROM documents WHERE id = ?",
+        (document_id,)
+    ).fetchone()
+    if not meta:
+        raise ValueError(f"Документ с id={document_id} не найден")
+    header = f"# newdoc id = {document_id}\n" + "".join(
+        f"# {name} = {_comment(value)}\n" for name, value in zip(_DOC_FIELDS, meta)
+    )
+    rows = conn.execute('''
+        SELECT s.id, s.sentence_text, t.token, t.lemma, t.pos, t.start, t.end, fb.bundle
+        FROM sentences s
+        JOIN tokens t ON t.sentence_id = s.id
+        LEFT JOIN feature_bundles fb ON fb.id = t.bundle_id
+        WHERE s.doc_id = ?
+        ORDER BY s.id, t.position, t.id
+    ''', (document_id,))
+    current = None
+    number = 0
+    for sent_id, sent_text, token, lemma, pos_tag, start, end, bundle in rows:
+        if sent_id != current:
+            out.write(header if current is None else '\n')
+            out.write(f"# sent_id = {sent_id}\n# text = {_comment(sent_text)}\n")
+            current = sent_id
+            number = 0
+        number += 1
+        out.write(
+            f"{number}\t{_field(token)}\t{_field(lemma)}\t{_field(pos_tag)}\t_\t{_field(bundle)}"
+            f"\t_\t_\t_\tTokenRange={start}:{end}\n"
+        )
+        counter.add()
+    if current is not None:
+        out.write('\n')
+
+
+def export_document_to_conllu(db, document_id: int, file_path: str, progress=None):
+    """Экспорт одного документа в CoNLL-U. Возвращает число выгруженных токенов."""
+    return stream_export(db, file_path, [document_id], _write_document, progress=progress)
+
+
+def export_database_to_conllu(db, file_path: str, progress=None):
+    """
+    Экспорт всей базы в CoNLL-U (по документу за раз, одной транзакцией
+    чтения). Столбцы XPOS, HEAD, DEPREL, DEPS не заполняются ('_').
+    Возвращает число выгруженных токенов.
+    """
+    return stream_export(db, file_path, None, _write_document, progress=progress)
+
+
+def _parse_sentence(comments, rows):
+    """
+    (текст, токены, absolute): токены — (form, lemma, upos, start, end, feats).
+    Смещения берутся из TokenRange; если его нет, считаются внутри текста
+    предложения (absolute=False) и сдвигаются при записи.
+    """
+    text = comments.get('text')
+    if text is None:
+        # Восстановление текста по SpaceAfter=No
+        parts = []
+        for cols in rows:
+            parts.append(cols[1])
+            if 'SpaceAfter=No' not in cols[9].split('|'):
+                parts.append(' ')
+        text = ''.join(parts).rstrip()
+    tokens = []
+    absolute = True
+    cursor = 0
+    for cols in rows:
+        form, lemma, upos, feats, misc = cols[1], cols[2], cols[3], cols[5], cols[9]
+        token_range = None
+        for item in misc.split('|'):
+            if item.startswith('TokenRange='):
+                token_range = item[11:].split(':')
+        if token_range is not None and len(token_range) == 2:
+            start, end = int(token_range[0]), int(token_range[1])
+        else:
+            absolute = False
+            found = text.find(form, cursor)
+            start = found if found >= 0 else cursor
+            end = start + len(form)
+            cursor = end
+        tokens.append((
+            form,
+            lemma if lemma != '_' or form == '_' else None,
+            upos if upos != '_' else None,
+            start, end,
+            BulkWriter.parse_bundle(feats if feats != '_' else None),
+        ))
+    return text, tokens, absolute
+
+
+def _parse_block(block):
+    """
+    Разбор фрагмента CoNLL-U из целых предложений (выполняется в рабочем
+    процессе). Возвращает [(doc_meta, текст, токены, absolute), ...]; doc_meta —
+    словарь комментариев '# newdoc' у первого предложения документа, иначе None.
+    Многословные токены (1-2) и пустые узлы (1.1) пропускаются.
+    """
+    sentences = []
+    comments, rows = {}, []
+    newdoc = None
+    for line in block.split('\n'):
+        line = line.rstrip('\r')
+        if not line:
+            if rows:
+                sentences.append((newdoc, *_parse_sentence(comments, rows)))
+                comments, rows, newdoc = {}, [], None
+            continue
+        if line.startswith('#'):
+            key, sep, value = line[1:].partition('=')
+            key, value = key.strip(), value.strip()
+            if key == 'newdoc' or key.startswith('newdoc '):
+                newdoc = {'id': value if sep else None}
+            elif newdoc is not None and key in _DOC_FIELDS:
+                newdoc[key] = value
+            elif sep:
+                comments[key] = value
+            continue
+        cols = line.split('\t')
+        if len(cols) != 10:
+            raise ValueError(f"CoNLL-U: ожидалось 10 столбцов, найдено {len(cols)}: {line[:60]!r}")
+        if cols[0].isdigit():
+            rows.append(cols)
+    if rows:
+        sentences.append((newdoc, *_parse_sentence(comments, rows)))
+    return sentences
+
+
+def _read_blocks(file_path, chunk_tokens):
+    """Фрагменты файла по границам предложений, примерно по chunk_tokens строк токенов."""
+    lines = []
+    count = 0
+    with open(file_path, encoding='utf-8') as f:
+        for line in f:
+            lines.append(line)
+            if line.strip():
+                count += not line.startswith('#')
+            elif count >= chunk_tokens:
+                yield ''.join(lines)
+                lines, count = [], 0
+    if lines:
+        yield ''.join(lines)
+
+
+def import_conllu(db, paths, workers: int = None, chunk_tokens: int = None, progress=None, drop_indexes=False,
+                  index=None):
+    """
+    Импорт размеченного корпуса из файлов CoNLL-U без морфологического
+    анализа (natasha не нужна). Документы начинаются с '# newdoc'
+    (название — '# title' или id, иначе имя файла); файл без '# newdoc' —
+    один документ. Документы с уже имеющимся названием пропускаются.
+
+    Файлы читаются последовательно фрагментами примерно по chunk_tokens
+    токенов (Config.IMPORT_CHUNK_TOKENS), фрагменты разбираются в пуле из
+    workers процессов (Config.CONLLU_WORKERS), в обработке держится не
+    больше 2·workers фрагментов. Результаты записываются по порядку через
+    BulkWriter, по транзакции на фрагмент под db.lock, пока процессы
+    разбирают следующие. При ошибке недописанный документ удаляется,
+    как при импорте из XML.
+
+    progress(tokens) вызывается после каждой записи.
+    index — инвертированный индекс, в который добавляется каждый документ.
+    Возвращает словарь: documents, skipped, tokens, seconds.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    workers = workers or Config.CONLLU_WORKERS
+    chunk_tokens = chunk_tokens or Config.IMPORT_CHUNK_TOKENS
+    writer = BulkWriter(db)
+    stats = {'documents': 0, 'skipped': 0, 'tokens': 0}
+    start_time = time.perf_counter()
+    doc_id = None
+    skip = False
+    # Смещение следующего предложения в документе, если нет TokenRange
+    offset = 0
+    # Документов в текущем файле (для названий по умолчанию)
+    file_documents = 0
+    batch = []
+
+    def flush():
+        nonlocal batch
+        if batch:
+            with db.lock:
+                stats['tokens'] += writer.write(doc_id, batch)
+            batch = []
+            if progress:
+                progress(stats['tokens'])
+
+    def finish_document():
+        nonlocal doc_id, skip
+        if doc_id is not None:
+            flush()
+            if index is not None:
+                index.add_document(doc_id)
+            stats['documents'] += 1
+        elif skip:
+            stats['skipped'] += 1
+        doc_id, skip = None, False
+
+    def start_document(meta, default_title):
+        nonlocal doc_id, skip, offset
+        finish_document()
+        doc_id = db.add_document(
+            meta.get('title') or meta.get('id') or default_title,
+            meta.get('author'), meta.get('date'), meta.get('genre')
+        )
+        skip = doc_id is None
+        if index is not None and not skip:
+            index.begin_document(doc_id)
+        offset = 0
+
+    def store(path, first, sentences):
+        nonlocal offset, file_documents
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if first:
+            file_documents = 0
+        for i, (meta, text, tokens, absolute) in enumerate(sentences):
+            if meta is not None or (first and i == 0):
+                file_documents += 1
+                start_document(meta or {}, stem if file_documents == 1 else f"{stem}-{file_documents}")
+            if skip:
+                continue
+            if not absolute:
+                tokens = [(form, lemma, pos, start + offset, end + offset, feats)
+                          for form, lemma, pos, start, end, feats in tokens]
+                offset += len(text) + 1
+            batch.append((text, tokens))
+        flush()
+
+    def blocks():
+        for path in paths:
+            for i, block in enumerate(_read_blocks(path, chunk_tokens)):
+                yield path, i == 0, block
+
+    if drop_indexes:
+        with db.lock:
+            writer.drop_indexes()
+    try:
+        if workers <= 1:
+            for path, first, block in blocks():
+                store(path, first, _parse_block(block))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for path, first, block in blocks():
+                    pending.append((path, first, pool.submit(_parse_block, block)))
+                    if len(pending) >= 2 * workers:
+                        path, first, future = pending.popleft()
+                        store(path, first, future.result())
+                while pending:
+                    path, first, future = pending.popleft()
+                    store(path, first, future.result())
+        finish_document()
+    except Exception:
+        if doc_id is not None:
+            db.delete_document(doc_id)
+            if index is not None:
+                index.delete_document(doc_id)
+        raise
+    finally:
+        if drop_indexes:
+            with db.lock:
+                writer.create_indexes()
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
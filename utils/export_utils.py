@@ -0,0 +1,54 @@
+import os
+from config import Config
+
+
+class RowCounter:
+    """Число выгруженных токенов и вызов progress(rows) каждые Config.EXPORT_PROGRESS_ROWS."""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.rows = 0
+        self._reported = 0
+
+    def add(self, rows=1):
+        self.rows += rows
+        if self.rows - self._reported >= Config.EXPORT_PROGRESS_ROWS:
+            self.done()
+
+    def done(self):
+        if self.progress and self.rows != self._reported:
+            self.progress(self.rows)
+        self._reported = self.rows
+
+
+def stream_export(db, file_path: str, document_ids, write_document, header='', footer='', progress=None):
+    """
+    Потоковая запись документов в file_path: в памяти находится только
+    текущая строка выборки. Чтение идёт через соединение пула db.reader()
+    одной транзакцией чтения (согласованный снимок в режиме WAL), поэтому
+    не блокирует ни поиск, ни запись.
+
+    write_document(out, conn, document_id, counter) записывает один документ
+    в текстовый поток out и отмечает выгруженные токены в counter (RowCounter);
+    document_ids=None — все документы по возрастанию id. header и footer
+    пишутся в начало и конец файла. Запись идёт во временный файл, так что
+    при ошибке не остаётся недописанного файла.
+    Возвращает число выгруженных токенов.
+    """
+    counter = RowCounter(progress)
+    tmp_path = file_path + '.tmp'
+    try:
+        with db.reader() as conn, open(tmp_path, 'w', encoding='utf-8', buffering=1 << 20) as out:
+            conn.execute("BEGIN")
+            if document_ids is None:
+                document_ids = [r[0] for r in conn.execute("SELECT id FROM documents ORDER BY id")]
+            out.write(header)
+            for document_id in document_ids:
+                write_document(out, conn, document_id, counter)
+            out.write(footer)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    counter.done()
+    return counter.rows
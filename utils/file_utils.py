@@ -1,28 +1,145 @@
-import pdfplumber
-from docx import Document as DocxDocument
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+from config import Config
 
-def extract_text(file_path):
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def iter_pages(file_path, workers=None):
+    """
+    Постраничное извлечение текста: генератор фрагментов, по одному на страницу.
+    Конкатенация фрагментов даёт полный текст документа (разделитель между
+    страницами входит в начало следующего фрагмента), поэтому позиции в них
+    совпадают с позициями в тексте, который возвращает extract_text.
+
+    workers > 1 включает параллельное извлечение для больших PDF
+    (от Config.PDF_PARALLEL_MIN_PAGES страниц); порядок страниц сохраняется.
+    """
+    if file_path.endswith('.txt'):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            while True:
+                page = f.read(Config.PAGE_SIZE)
+                if not page:
+                    break
+                yield page
+
+    elif file_path.endswith('.pdf'):
+        for i, text in enumerate(_iter_pdf_pages(file_path, workers)):
+            yield '\n' + text if i else text
+
+    elif file_path.endswith('.docx'):
+        for i, page in enumerate(_iter_docx_pages(file_path)):
+            yield '\n' + page if i else page
+
+
+def _extract_pdf_range(file_path, first, last):
+    """Извлекает страницы [first, last) — выполняется в рабочем процессе."""
+    import pdfplumber
+    texts = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages[first:last]:
+            texts.append(page.extract_text() or '')
+            page.close()
+    return texts
+
+
+def _iter_pdf_pages(file_path, workers=None):
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        page_count = len(pdf.pages)
+        if not workers or workers < 2 or page_count < Config.PDF_PARALLEL_MIN_PAGES:
+            for page in pdf.pages:
+                text = page.extract_text() or ''
+                page.close()
+                yield text
+            return
+
+    # Несколько диапазонов на процесс, чтобы выровнять нагрузку между ними
+    step = max(1, -(-page_count // (workers * 4)))
+    ranges = [(first, min(first + step, page_count)) for first in range(0, page_count, step)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            _extract_pdf_range,
+            [file_path] * len(ranges),
+            [first for first, _ in ranges],
+            [last for _, last in ranges]
+        )
+        # map отдаёт результаты в порядке диапазонов по мере готовности
+        for texts in results:
+            yield from texts
+
+
+def _iter_docx_pages(file_path):
+    """
+    Потоковое чтение word/document.xml без построения модели python-docx.
+    Страницы разделяются по <w:br w:type="page"/> и <w:lastRenderedPageBreak/>;
+    повторный разрыв на странице без текста (ручной разрыв в отдельном абзаце +
+    отметка Word) не учитывается: пустые абзацы такой страницы переходят в следующую.
+    Табуляция берётся только из прогонов <w:r> (как paragraph.text), а не из
+    позиций табуляции в <w:pPr>. Разобранные элементы <w:body> удаляются из
+    дерева, так что память не растёт с размером документа.
+    """
+    paragraphs = []
+    current = []
+    body = None
+    # Глубина вложенности от <w:body> и число открытых прогонов <w:r>
+    depth = 0
+    runs = 0
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open('word/document.xml') as xml_file:
+            for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+                tag = elem.tag
+                is_break = (
+                    (tag == _W + 'br' and elem.get(_W + 'type') == 'page')
+                    or tag == _W + 'lastRenderedPageBreak'
+                )
+                if event == 'start':
+                    if body is not None:
+                        depth += 1
+                    elif tag == _W + 'body':
+                        body = elem
+                    if tag == _W + 'r':
+                        runs += 1
+                    if is_break and (any(paragraphs) or ''.join(current)):
+                        # Разрыв внутри абзаца: начало абзаца остаётся на текущей странице
+                        if current:
+                            paragraphs.append(''.join(current))
+                            current = []
+                        yield '\n'.join(paragraphs)
+                        paragraphs = []
+                    continue
+
+                if tag == _W + 't':
+                    current.append(elem.text or '')
+                elif tag == _W + 'tab':
+                    if runs:
+                        current.append('\t')
+                elif tag == _W + 'br' and not is_break:
+                    current.append('\n')
+                elif tag == _W + 'r':
+                    runs -= 1
+                elif tag == _W + 'p':
+                    paragraphs.append(''.join(current))
+                    current = []
+                    elem.clear()
+                if body is not None and elem is not body:
+                    depth -= 1
+                    if depth == 0:
+                        # Абзац, таблица или sectPr разобраны: убираем из дерева
+                        elem.clear()
+                        body.remove(elem)
+    if any(paragraphs) or ''.join(current):
+        if current:
+            paragraphs.append(''.join(current))
+        yield '\n'.join(paragraphs)
+
+
+def extract_text(file_path, workers=None):
     try:
-        if file_path.endswith('.txt'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            return {'text': text, 'page_count': len(text) // Config.PAGE_SIZE + 1}
-        
-        elif file_path.endswith('.pdf'):
-            with pdfplumber.open(file_path) as pdf:
-                text = '\n'.join(page.extract_text() for page in pdf.pages)
-                return {'text': text, 'page_count': len(pdf.pages)}
-        
-        elif file_path.endswith('.docx'):
-            doc = DocxDocument(file_path)
-            paragraphs = [p.text for p in doc.paragraphs]
-            # Подсчет страниц через разрывы (если есть)
-            page_count = 1
-            for p in doc.paragraphs:
-                if 'PAGE' in p.text.upper() and 'BREAK' in p.text.upper():
-                    page_count += 1
-            return {'text': '\n'.join(paragraphs), 'page_count': page_count}
-        
-        return None
+        pages = list(iter_pages(file_path, workers))
+        if not pages:
+            return None
+        return {'text': ''.join(pages), 'page_count': len(pages)}
     except Exception:
-        return None
\ No newline at end of file
+        return None
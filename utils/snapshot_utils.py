@@ -0,0 +1,202 @@
+import json
+import os
+import time
+from array import array
+import numpy as np
+from config import Config
+from models.bulk_writer import BulkWriter
+from models.corpus_snapshot import BlobWriter, CorpusSnapshot, FORMAT_VERSION, TOKEN_COLUMNS
+
+# Предложения с документом, в порядке выгрузки токенов
+_SENTENCES_SQL = '''
+    SELECT s.doc_id, s.sentence_text,
+           (SELECT COUNT(*) FROM tokens t WHERE t.sentence_id = s.id)
+    FROM sentences s
+    JOIN documents d ON d.id = s.doc_id
+    ORDER BY s.doc_id, s.id
+'''
+
+_TOKENS_SQL = '''
+    SELECT t.token, t.lemma, t.pos, t.bundle_id, t.start, t.end
+    FROM sentences s
+    JOIN documents d ON d.id = s.doc_id
+    CROSS JOIN tokens t INDEXED BY idx_sentence_position ON t.sentence_id = s.id
+    ORDER BY s.doc_id, s.id, t.position
+'''
+
+
+def export_snapshot(db, path: str, progress=None):
+    """
+    Выгрузка корпуса в колоночный снимок (models.corpus_snapshot) в каталог path.
+
+    Чтение — одна транзакция соединения пула db.reader(), как при экспорте
+    в XML. Столбцы токенов пишутся в .npy через open_memmap пакетами по
+    Config.EXPORT_PROGRESS_ROWS строк; в памяти остаются только словарь форм
+    и по одному числу на предложение. manifest.json пишется последним:
+    снимок без него не открывается. Возвращает число выгруженных токенов.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    with db.reader() as conn:
+        conn.execute("BEGIN")
+        documents = []
+        doc_index = {}
+        texts = BlobWriter(os.path.join(path, 'document_text'))
+        for doc_id, title, author, date, genre, processing_time, page_count in conn.execute(
+                "SELECT id, title, author, date, genre, processing_time, page_count "
+                "FROM documents ORDER BY id").fetchall():
+            doc_index[doc_id] = len(documents)
+            documents.append({
+                'title': title, 'author': author, 'date': date, 'genre': genre,
+                'processing_time': processing_time, 'page_count': page_count,
+            })
+            texts.add(conn.execute("SELECT text FROM documents WHERE id = ?", (doc_id,)).fetchone()[0])
+        texts.close()
+
+        # Границы предложений по числу их токенов
+        sentence_doc = array('i')
+        sentence_sizes = array('q')
+        texts = BlobWriter(os.path.join(path, 'sentence_text'))
+        for doc_id, sentence_text, size in conn.execute(_SENTENCES_SQL):
+            sentence_doc.append(doc_index[doc_id])
+            sentence_sizes.append(size)
+            texts.add(sentence_text)
+        texts.close()
+        sentence_sizes = np.frombuffer(sentence_sizes, dtype=np.int64)
+        sentence_doc = np.frombuffer(sentence_doc, dtype=np.int32)
+        sentence_offsets = np.zeros(len(sentence_sizes) + 1, dtype=np.int64)
+        np.cumsum(sentence_sizes, out=sentence_offsets[1:])
+        np.save(os.path.join(path, 'sentence_offsets.npy'), sentence_offsets)
+        np.save(os.path.join(path, 'sentence_doc.npy'), sentence_doc)
+        count = int(sentence_offsets[-1])
+
+        columns = {
+            name: np.lib.format.open_memmap(
+                os.path.join(path, name + '.npy'), mode='w+', dtype=np.int32, shape=(count,)
+            )
+            for name in TOKEN_COLUMNS
+        }
+        columns['sentence'][:] = np.repeat(np.arange(len(sentence_sizes), dtype=np.int32), sentence_sizes)
+        columns['doc'][:] = np.repeat(sentence_doc, sentence_sizes)
+        del sentence_sizes
+
+        # Формы, части речи и наборы признаков кодируются номерами
+        forms, pos_tags = {}, {}
+        bundles = conn.execute("SELECT id, bundle FROM feature_bundles ORDER BY id").fetchall()
+        bundle_index = {bundle_id: i for i, (bundle_id, _) in enumerate(bundles)}
+        filled = 0
+        cursor = conn.execute(_TOKENS_SQL)
+        while True:
+            rows = cursor.fetchmany(Config.EXPORT_PROGRESS_ROWS)
+            if not rows:
+                break
+            if filled + len(rows) > count:
+                raise RuntimeError("Снимок: число токенов изменилось во время выгрузки")
+            token, lemma, pos, bundle, start, end = zip(*rows)
+            stop = filled + len(rows)
+            columns['token'][filled:stop] = [-1 if v is None else forms.setdefault(v, len(forms)) for v in token]
+            columns['lemma'][filled:stop] = [-1 if v is None else forms.setdefault(v, len(forms)) for v in lemma]
+            columns['pos'][filled:stop] = [-1 if v is None else pos_tags.setdefault(v, len(pos_tags)) for v in pos]
+            columns['bundle'][filled:stop] = [-1 if v is None else bundle_index[v] for v in bundle]
+            columns['start'][filled:stop] = start
+            columns['end'][filled:stop] = end
+            filled = stop
+            if progress:
+                progress(filled)
+        if filled != count:
+            raise RuntimeError("Снимок: число токенов изменилось во время выгрузки")
+        for column in columns.values():
+            column.flush()
+        del columns
+
+    blob = BlobWriter(os.path.join(path, 'forms'))
+    for form in forms:
+        blob.add(form)
+    blob.close()
+    manifest = {
+        'format': FORMAT_VERSION,
+        'documents': documents,
+        'pos': list(pos_tags),
+        'bundles': [bundle for _, bundle in bundles],
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return count
+
+
+def import_snapshot(db, path: str, chunk_tokens: int = None, progress=None, drop_indexes=False, index=None):
+    """
+    Загрузка снимка корпуса в базу db: документы добавляются по одному,
+    аннотации — через BulkWriter транзакциями по chunk_tokens токенов
+    (по умолчанию Config.IMPORT_CHUNK_TOKENS), как при импорте из XML.
+    Документы с уже существующим названием пропускаются; при ошибке
+    недозаписанный документ удаляется. Словарь форм декодируется один раз,
+    столбцы читаются срезами из mmap. index — инвертированный индекс,
+    в который добавляется каждый документ.
+    Возвращает {'documents', 'skipped', 'tokens', 'seconds'}.
+    """
+    start_time = time.perf_counter()
+    chunk_tokens = chunk_tokens or Config.IMPORT_CHUNK_TOKENS
+    snapshot = CorpusSnapshot(path)
+    writer = BulkWriter(db)
+    forms = [snapshot.forms[i] for i in range(len(snapshot.forms))] + [None]
+    pos_tags = snapshot.pos_tags + [None]
+    feats = [BulkWriter.parse_bundle(bundle) for bundle in snapshot.bundles] + [None]
+    offsets = snapshot.sentence_offsets
+    doc_bounds = np.searchsorted(snapshot.sentence_doc, np.arange(len(snapshot.documents) + 1))
+    stats = {'documents': 0, 'skipped': 0, 'tokens': 0}
+
+    if drop_indexes:
+        with db.lock:
+            writer.drop_indexes()
+    try:
+        for i, meta in enumerate(snapshot.documents):
+            doc_id = db.add_document(
+                meta['title'], meta['author'], meta['date'], meta['genre'],
+                snapshot.document_texts[i], meta['processing_time'], meta['page_count']
+            )
+            if doc_id is None:
+                stats['skipped'] += 1
+                continue
+            if index is not None:
+                index.begin_document(doc_id)
+            try:
+                first, last = int(doc_bounds[i]), int(doc_bounds[i + 1])
+                while first < last:
+                    # Предложения, начинающиеся в пределах chunk_tokens токенов (хотя бы одно)
+                    stop = int(np.searchsorted(offsets, offsets[first] + chunk_tokens, side='right')) - 1
+                    stop = min(max(stop, first + 1), last)
+                    begin, end = int(offsets[first]), int(offsets[stop])
+                    token, lemma, pos, bundle, start, finish = (
+                        snapshot.columns[name][begin:end].tolist() for name in TOKEN_COLUMNS[:6]
+                    )
+                    rows = [
+                        (forms[t], forms[l], pos_tags[p], s, e, feats[b])
+                        for t, l, p, b, s, e in zip(token, lemma, pos, bundle, start, finish)
+                    ]
+                    annotated = [
+                        (snapshot.sentence_texts[j], rows[offsets[j] - begin:offsets[j + 1] - begin])
+                        for j in range(first, stop)
+                    ]
+                    with db.lock:
+                        stats['tokens'] += writer.write(doc_id, annotated)
+                    if progress:
+                        progress(stats['tokens'])
+                    first = stop
+            except Exception:
+                db.delete_document(doc_id)
+                if index is not None:
+                    index.delete_document(doc_id)
+                raise
+            if index is not None:
+                index.add_document(doc_id)
+            stats['documents'] += 1
+    finally:
+        if drop_indexes:
+            with db.lock:
+                writer.create_indexes()
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
@@ -1,130 +1,202 @@
+import time
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from config import Config
 from models.document import Document
+from models.bulk_writer import BulkWriter
+from utils.export_utils import RowCounter, stream_export
 
 
-def _build_document_element(db, document_id: int) -> ET.Element:
+def _element(name, text):
+    """<name>text</name> с экранированием; пустой элемент для None и ''."""
+    if text is None or text == '':
+        return f"<{name}/>"
+    return f"<{name}>{escape(str(text))}</{name}>"
+
+
+def _write_document(out, conn, document_id: int, counter: RowCounter):
     """
-    Создаёт XML-элемент <document> с метаданными и аннотациями,
-    основанными на данных SQLite (таблицы documents, sentences, tokens).
+    Записывает <document> с метаданными и аннотациями в текстовый поток out.
+    Предложения и токены документа читаются одним упорядоченным запросом и
+    выводятся по мере чтения; наборы грамматических признаков — строкой
+    'Case=Gen|Number=Plur' в <features>.
     """
-    with db.lock, db.conn:
-        cur = db.conn.cursor()
-        # Метаданные документа
-        cur.execute(
-            "SELECT title, author, date, genre FROM documents WHERE id = ?",
-            (document_id,)
+    meta = conn.execute(
+        "SELECT title, author, date, genre FROM documents WHERE id = ?",
+        (document_id,)
+    ).fetchone()
+    if not meta:
+        raise ValueError(f"Документ с id={document_id} не найден")
+    title, author, date, genre = meta
+
+    out.write(
+        f'<document id="{document_id}">'
+        + _element('title', title) + _element('author', author)
+        + _element('date', date) + _element('genre', genre)
+        + '<annotations>'
+    )
+    rows = conn.execute('''
+        SELECT s.id, s.sentence_text, t.id, t.token, t.lemma, t.pos, t.start, t.end, fb.bundle
+        FROM sentences s
+        LEFT JOIN tokens t ON t.sentence_id = s.id
+        LEFT JOIN feature_bundles fb ON fb.id = t.bundle_id
+        WHERE s.doc_id = ?
+        ORDER BY s.id, t.position, t.id
+    ''', (document_id,))
+    current = None
+    for sent_id, sent_text, tok_id, tok_text, lemma, pos_tag, start, end, bundle in rows:
+        if sent_id != current:
+            if current is not None:
+                out.write('</sentence>\n')
+            current = sent_id
+            out.write(f'<sentence id="{sent_id}">' + _element('text', sent_text))
+        if tok_id is None:
+            # предложение без токенов
+            continue
+        out.write(
+            f'<token id="{tok_id}">'
+            + _element('text', tok_text) + _element('lemma', lemma) + _element('pos', pos_tag)
+            + _element('start', start) + _element('end', end)
+            + (_element('features', bundle) if bundle else '')
+            + '</token>'
         )
-        meta = cur.fetchone()
-        if not meta:
-            raise ValueError(f"Документ с id={document_id} не найден")
-        title, author, date, genre = meta
-
-        doc_elem = ET.Element('document', id=str(document_id))
-        ET.SubElement(doc_elem, 'title').text = title
-        ET.SubElement(doc_elem, 'author').text = author
-        ET.SubElement(doc_elem, 'date').text = date
-        ET.SubElement(doc_elem, 'genre').text = genre
-
-        # Аннотации: предложения
-        cur.execute(
-            "SELECT id, sentence_text FROM sentences WHERE doc_id = ? ORDER BY id",
-            (document_id,)
-        )
-        sentences = cur.fetchall()
-
-        annotations = ET.SubElement(doc_elem, 'annotations')
-        for sent_id, sent_text in sentences:
-            sent_elem = ET.SubElement(annotations, 'sentence', id=str(sent_id))
-            ET.SubElement(sent_elem, 'text').text = sent_text
-
-            # Токены соответствующего предложения
-            cur.execute(
-                "SELECT id, token, lemma, pos, start, end FROM tokens "
-                "WHERE sentence_id = ? ORDER BY id",
-                (sent_id,)
-            )
-            tokens = cur.fetchall()
-            for tok_id, tok_text, lemma, pos_tag, start, end in tokens:
-                token_elem = ET.SubElement(sent_elem, 'token', id=str(tok_id))
-                ET.SubElement(token_elem, 'text').text = tok_text
-                ET.SubElement(token_elem, 'lemma').text = lemma
-                ET.SubElement(token_elem, 'pos').text = pos_tag
-                ET.SubElement(token_elem, 'start').text = str(start)
-                ET.SubElement(token_elem, 'end').text = str(end)
-
-    return doc_elem
-
-
-def export_document_to_xml(db, document_id: int, file_path: str):
+        counter.add()
+    if current is not None:
+        out.write('</sentence>')
+    out.write('</annotations></document>\n')
+
+
+def _export(db, file_path: str, document_ids, root, progress=None):
+    """Потоковая запись документов в XML (см. export_utils.stream_export)."""
+    header = "<?xml version='1.0' encoding='utf-8'?>\n" + (f"<{root}>\n" if root else '')
+    footer = f"</{root}>\n" if root else ''
+    return stream_export(db, file_path, document_ids, _write_document, header, footer, progress)
+
+
+def export_document_to_xml(db, document_id: int, file_path: str, progress=None):
     """
     Экспорт конкретного документа в XML с аннотацией из SQLite.
+    progress(rows) получает число выгруженных токенов.
     """
-    doc_elem = _build_document_element(db, document_id)
-    tree = ET.ElementTree(doc_elem)
-    tree.write(file_path, encoding='utf-8', xml_declaration=True)
+    return _export(db, file_path, [document_id], None, progress)
 
 
-def export_database_to_xml(db, file_path: str):
+def export_database_to_xml(db, file_path: str, progress=None):
     """
-    Экспорт всей базы документов в один XML-файл с аннотациями.
+    Экспорт всей базы документов в один XML-файл с аннотациями
+    (потоково, см. export_utils.stream_export).
+    progress(rows) получает число выгруженных токенов.
     """
-    root = ET.Element('corpus')
-    with db.lock, db.conn:
-        cur = db.conn.cursor()
-        cur.execute("SELECT id FROM documents ORDER BY id")
-        doc_ids = [r[0] for r in cur.fetchall()]
+    return _export(db, file_path, None, 'corpus', progress)
 
-    for doc_id in doc_ids:
-        doc_elem = _build_document_element(db, doc_id)
-        root.append(doc_elem)
 
-    tree = ET.ElementTree(root)
-    tree.write(file_path, encoding='utf-8', xml_declaration=True)
+def _sentence_tokens(sent_elem):
+    tokens = []
+    for token_elem in sent_elem.iterfind('token'):
+        tokens.append((
+            token_elem.findtext('text'),
+            token_elem.findtext('lemma'),
+            token_elem.findtext('pos'),
+            int(token_elem.findtext('start') or 0),
+            int(token_elem.findtext('end') or 0),
+            BulkWriter.parse_bundle(token_elem.findtext('features')),
+        ))
+    return tokens
 
 
-def import_database_from_xml(db, file_path: str):
+def import_database_from_xml(db, file_path: str, chunk_tokens: int = None, progress=None, drop_indexes=False,
+                             index=None):
     """
-    Импорт документов и аннотаций из XML, добавление без удаления существующих.
-    Предполагает таблицы documents, sentences и tokens.
+    Импорт документов и аннотаций из XML, добавление без удаления существующих
+    (документы с уже имеющимся названием пропускаются).
+
+    Файл читается потоково (iterparse): разобранные предложения и документы
+    сразу удаляются из дерева, в памяти — не больше одной порции. Предложения
+    записываются через BulkWriter (executemany, заранее назначенные id,
+    статистика и частотные таблицы) порциями примерно по chunk_tokens
+    токенов (Config.IMPORT_CHUNK_TOKENS); каждая порция — отдельная транзакция
+    под db.lock, между ними работают поиск и другие записи. При ошибке
+    недописанный документ удаляется, уже импортированные остаются.
+    Грамматические признаки берутся из <features> (см. export_database_to_xml).
+
+    progress(tokens) вызывается после каждой порции.
+    drop_indexes — удалить индексы tokens на время импорта (для больших файлов).
+    index — инвертированный индекс (models.inverted_index), в который
+    добавляется каждый импортированный документ.
+    Возвращает словарь: documents, skipped, tokens, seconds.
     """
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-
-    with db.lock, db.conn:
-        cur = db.conn.cursor()
-        for doc_elem in root.findall('document'):
-            title = doc_elem.findtext('title')
-            author = doc_elem.findtext('author')
-            date = doc_elem.findtext('date')
-            genre = doc_elem.findtext('genre')
-
-            # Вставляем новый документ, если ещё нет
-            cur.execute("SELECT COUNT(*) FROM documents WHERE title = ?", (title,))
-            if cur.fetchone()[0] == 0:
-                cur.execute(
-                    "INSERT INTO documents (title, author, date, genre, text, processing_time, page_count) "
-                    "VALUES (?, ?, ?, ?, '', NULL, NULL)",
-                    (title, author, date, genre)
-                )
-                new_doc_id = cur.lastrowid
-
-                # Вставляем предложения и токены
-                for sent_elem in doc_elem.find('annotations').findall('sentence'):
-                    sent_text = sent_elem.findtext('text') or ''
-                    cur.execute(
-                        "INSERT INTO sentences (doc_id, sentence_text) VALUES (?, ?)",
-                        (new_doc_id, sent_text)
+    chunk_tokens = chunk_tokens or Config.IMPORT_CHUNK_TOKENS
+    writer = BulkWriter(db)
+    stats = {'documents': 0, 'skipped': 0, 'tokens': 0}
+    start_time = time.perf_counter()
+    root = doc_elem = annotations = None
+    doc_id = None
+    skip = False
+    batch, batch_tokens = [], 0
+
+    def flush():
+        nonlocal batch, batch_tokens
+        if batch:
+            with db.lock:
+                stats['tokens'] += writer.write(doc_id, batch)
+            batch, batch_tokens = [], 0
+            if progress:
+                progress(stats['tokens'])
+
+    if drop_indexes:
+        with db.lock:
+            writer.drop_indexes()
+    try:
+        for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                if elem.tag == 'document':
+                    doc_elem = elem
+                elif elem.tag == 'annotations' and doc_elem is not None:
+                    # Метаданные предшествуют аннотациям и уже разобраны
+                    annotations = elem
+                    doc_id = db.add_document(
+                        doc_elem.findtext('title'), doc_elem.findtext('author'),
+                        doc_elem.findtext('date'), doc_elem.findtext('genre')
                     )
-                    new_sent_id = cur.lastrowid
-                    for token_elem in sent_elem.findall('token'):
-                        tok_text = token_elem.findtext('text')
-                        lemma = token_elem.findtext('lemma')
-                        pos_tag = token_elem.findtext('pos')
-                        start = int(token_elem.findtext('start') or 0)
-                        end = int(token_elem.findtext('end') or 0)
-                        cur.execute(
-                            "INSERT INTO tokens (sentence_id, token, lemma, pos, start, end) "
-                            "VALUES (?, ?, ?, ?, ?, ?)",
-                            (new_sent_id, tok_text, lemma, pos_tag, start, end)
-                        )
-        db.conn.commit()
+                    skip = doc_id is None
+                    if index is not None and not skip:
+                        index.begin_document(doc_id)
+                continue
+
+            if elem.tag == 'sentence' and annotations is not None:
+                if not skip:
+                    sent_tokens = _sentence_tokens(elem)
+                    batch.append((elem.findtext('text') or '', sent_tokens))
+                    batch_tokens += len(sent_tokens)
+                    if batch_tokens >= chunk_tokens:
+                        flush()
+                # Предложение больше не нужно: убираем его из дерева
+                annotations.remove(elem)
+            elif elem.tag == 'document':
+                if doc_id is not None:
+                    flush()
+                    if index is not None:
+                        index.add_document(doc_id)
+                    stats['documents'] += 1
+                elif skip:
+                    stats['skipped'] += 1
+                doc_elem = annotations = doc_id = None
+                skip = False
+                elem.clear()
+                if elem is not root:
+                    root.remove(elem)
+    except Exception:
+        if doc_id is not None:
+            db.delete_document(doc_id)
+            if index is not None:
+                index.delete_document(doc_id)
+        raise
+    finally:
+        if drop_indexes:
+            with db.lock:
+                writer.create_indexes()
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
+
@@ -5,6 +5,7 @@ from views.filter_panel import FilterPanel
 from views.document_list_view import DocumentListView
 from views.document_content_view import DocumentContentView
 from views.search_view import SearchView
+from controllers.query_executor import QueryExecutor
 
 class MainView:
     def __init__(self, root, doc_ctrl, search_ctrl):
@@ -20,6 +21,8 @@ class MainView:
         self.doc_ctrl = doc_ctrl
         self.search_ctrl = search_ctrl
         self.active_filters: dict[str, str] = {}
+        # Запросы выполняются в фоновых потоках, результаты забираются в check_query_results
+        self.executor = QueryExecutor(self.search_ctrl.db)
 
         # Меню
         MenuView(root, self.doc_ctrl, self.update_document_list)
@@ -63,6 +66,7 @@ class MainView:
         # Инициализируем список документов
         self.update_document_list()
         self.check_progress_queue()
+        self.check_query_results()
 
     def check_progress_queue(self):
         try:
@@ -73,14 +77,18 @@ class MainView:
             pass
         self.root.after(100, self.check_progress_queue)
 
+    def check_query_results(self):
+        self.executor.deliver()
+        self.root.after(20, self.check_query_results)
+
        
         
        
 
     def update_document_list(self):
         """Обновить дерево документов из БД"""
-        with self.doc_ctrl.db.lock, self.doc_ctrl.db.conn:
-            cur = self.doc_ctrl.db.conn.cursor()
+        with self.doc_ctrl.db.reader() as conn:
+            cur = conn.cursor()
             cur.execute('SELECT id, title, author, date, genre FROM documents')
             docs = cur.fetchall()
         self.doc_list.update(docs)
@@ -107,18 +115,7 @@ class MainView:
 
     def trigger_search_update(self):
         """Обновление результатов с текущими параметрами"""
-        current_query = self.search_view.entry.get().strip()
-        current_type = self.search_view.type_cmb.get()
-        
-        if current_query or self.active_filters:
-            results = self.perform_search(
-                stype=current_type,
-                query=current_query,
-                _filters=self.active_filters.copy(),
-                left=self.search_view.ctx_left.get(),
-                right=self.search_view.ctx_right.get()
-            )
-            self.search_view._update_results(results)
+        self.search_view.start_search()
 
     def on_reset_all_filters(self):
         self.active_filters.clear()
@@ -128,22 +125,36 @@ class MainView:
             self.root.after_cancel(self.search_debounce_id)
         self.search_debounce_id = self.root.after(500, self.trigger_search_update)
 
-    def perform_search(self, stype: str, query: str, _filters: dict, left: int, right: int):
-        return self.search_ctrl.search(stype, query, self.active_filters.copy(), left, right)
+    def perform_search(self, stype: str, query: str, filters: dict, partial: bool, after=None):
+        """
+        Страница результатов поиска и курсор следующей страницы (частичный поиск — по подстроке).
+        Для шаблона признаки задаются в самом запросе, фильтры панели не применяются.
+        """
+        if stype == "Шаблон":
+            return self.search_ctrl.search_pattern(query, after)
+        return self.search_ctrl.search_page(stype, query, filters, partial, after, substring=True)
+
+    def count_results(self, stype: str, query: str, filters: dict, partial: bool):
+        if stype == "Шаблон":
+            return self.search_ctrl.count_pattern(query)
+        return self.search_ctrl.count(stype, query, filters, partial, substring=True)
 
     def on_search_result_selected(self, token: str, lemma: str, pos: str, doc_title: str, left: int, right: int):
-        lines = self.search_ctrl.get_concordance(token, left, right)
-        self.search_view.show_concordance(lines)
+        if self.search_view.type_cmb.get() == "Шаблон":
+            # грамматика и конкорданс — первого токена совпадения
+            token, lemma, pos = (value.split(" ")[0] for value in (token, lemma, pos))
         # 1) грамматика
         translated_pos = self.search_ctrl.translator.translate_filter_display("pos", pos) 
-        feats = self.search_ctrl.get_grammar(token, lemma, translated_pos, doc_title)
-        self.search_view.show_grammar(feats)
+        self.executor.submit(
+            'grammar',
+            lambda: self.search_ctrl.get_grammar(token, lemma, translated_pos, doc_title),
+            self.search_view.show_grammar
+        )
 
         # 2) конкорданс
         left = self.search_view.ctx_left.get()
         right = self.search_view.ctx_right.get()
-        lines = self.search_ctrl.get_concordance(token, left, right)
-        self.search_view.show_concordance(lines)
+        self.search_view.start_concordance(token, left, right)
 
     def on_word_selected(self, word: str):
         if not self.doc_list.tree.selection():
@@ -152,36 +163,33 @@ class MainView:
 
         doc_id = self.doc_list.tree.selection()[0]
         doc_title = self.doc_list.tree.item(doc_id, "values")[0]
-
-        with self.search_ctrl.db.lock, self.search_ctrl.db.conn:
-            cur = self.search_ctrl.db.conn.cursor()
-            cur.execute("""
-                SELECT t.lemma, t.pos 
-                FROM tokens t
-                JOIN sentences s ON t.sentence_id = s.id
-                JOIN documents d ON s.doc_id = d.id
-                WHERE t.token = ? AND d.title = ?
-                LIMIT 1
-            """, (word, doc_title))
-            result = cur.fetchone()
-
-        if not result:
-            print(f"Токен '{word}' не найден в документе '{doc_title}'.")
-            return
-
-        lemma, pos = result
-
-        # Переводим часть речи в отображаемый формат
-        translated_pos = self.search_ctrl.translator.translate_pos(pos)
-
-        # Получаем грамматику
-        feats = self.search_ctrl.get_grammar(word, lemma, pos, doc_title)
-
-        # Получаем конкорданс
         left = self.search_view.ctx_left.get()
         right = self.search_view.ctx_right.get()
-        lines = self.search_ctrl.get_concordance(word, left, right)
 
-        # Обновляем отображение
-        self.search_view.show_grammar(feats)
-        self.search_view.show_concordance(lines)
\ No newline at end of file
+        def lookup():
+            with self.search_ctrl.db.reader() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT t.lemma, t.pos 
+                    FROM tokens t
+                    JOIN sentences s ON t.sentence_id = s.id
+                    JOIN documents d ON s.doc_id = d.id
+                    WHERE t.token = ? AND d.title = ?
+                    LIMIT 1
+                """, (word, doc_title))
+                result = cur.fetchone()
+            if not result:
+                return None
+            lemma, pos = result
+            # Получаем грамматику
+            return self.search_ctrl.get_grammar(word, lemma, pos, doc_title)
+
+        def show(feats):
+            if feats is None:
+                print(f"Токен '{word}' не найден в документе '{doc_title}'.")
+                return
+            # Обновляем отображение
+            self.search_view.show_grammar(feats)
+            self.search_view.start_concordance(word, left, right)
+
+        self.executor.submit('grammar', lookup, show)
@@ -1,7 +1,6 @@
 import tkinter as tk
 from tkinter import messagebox
 from views.dialogs import AddDocumentDialog
-from views.report_view import ReportWindow
 from tkinter import filedialog, messagebox
 from utils.xml_utils import (
     import_database_from_xml,
@@ -60,6 +59,8 @@ class MenuView:
         if not stats:
             tk.messagebox.showinfo("Информация", "Нет данных для отображения")
             return
+        # matplotlib/scipy загружаются только при открытии отчёта
+        from views.report_view import ReportWindow
         ReportWindow(self.root, stats)
 
     def _on_add(self):
@@ -87,7 +88,7 @@ class MenuView:
         if not path:
             return
         try:
-            import_database_from_xml(self.doc_ctrl.db, path)
+            import_database_from_xml(self.doc_ctrl.db, path, index=self.doc_ctrl.index)
             self.update_list()
             messagebox.showinfo("Импорт", "Импорт успешно завершён")
         except Exception as e:
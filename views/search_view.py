@@ -2,6 +2,7 @@
 
 import tkinter as tk
 from tkinter import ttk
+from config import Config
 
 class SearchView(ttk.Frame):
     def __init__(self, parent, main_view, search_ctrl, on_search, on_result_select, get_concordance):
@@ -25,7 +26,7 @@ class SearchView(ttk.Frame):
         bar = ttk.LabelFrame(self, text="Поиск")
         bar.pack(fill=tk.X)
         self.entry = ttk.Entry(bar, width=40); self.entry.pack(side=tk.LEFT, padx=5)
-        self.type_cmb = ttk.Combobox(bar, values=["Лемма","Словоформа"], state="readonly", width=12)
+        self.type_cmb = ttk.Combobox(bar, values=["Лемма","Словоформа","Шаблон"], state="readonly", width=12)
         self.type_cmb.current(0); self.type_cmb.pack(side=tk.LEFT)
         ttk.Button(bar, text="Искать", command=self._search).pack(side=tk.LEFT, padx=5)
 
@@ -43,10 +44,19 @@ class SearchView(ttk.Frame):
         pane.pack(fill=tk.BOTH, expand=True)
         # — дерево
         left = ttk.Frame(pane); pane.add(left, weight=1)
-        self.tree = ttk.Treeview(left, columns=("token","lemma","pos","doc","sentence"), show="headings")
-        for c,t in [("token","Слово"),("lemma","Лемма"),("pos","Часть речи"),("doc","Документ")]:
+        # Результаты подгружаются страницами при прокрутке к концу списка
+        self.lbl_total = tk.StringVar()
+        ttk.Label(left, textvariable=self.lbl_total).pack(side=tk.BOTTOM, anchor="w")
+        tree_sb = ttk.Scrollbar(left); tree_sb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree = ttk.Treeview(left, columns=("token","lemma","pos","doc","sentence"), show="headings",
+                                 yscrollcommand=lambda first, last: self._on_tree_scroll(tree_sb, first, last))
+        for c,t in [("token","Слово"),("lemma","Лемма"),("pos","Часть речи"),("doc","Документ"),("sentence","Предложение")]:
             self.tree.heading(c, text=t)
+        tree_sb.config(command=self.tree.yview)
         self.tree.pack(fill=tk.BOTH, expand=True)
+        self._search_params = None
+        self._search_cursor = None
+        self._page_loading = False
         self.tree.bind("<<TreeviewSelect>>", self._on_select)
 
         # — детали
@@ -61,6 +71,11 @@ class SearchView(ttk.Frame):
         self.txt_gram = tk.Text(right, height=4, state='disabled'); self.txt_gram.pack(fill=tk.X, pady=2)
 
         ttk.Label(right, text="Конкорданс:").pack(anchor="w", pady=(10,0))
+        # Конкорданс выводится страницами: следующая подгружается по кнопке
+        self.btn_more_conc = ttk.Button(right, text="Показать ещё", command=self._more_concordance, state='disabled')
+        self.btn_more_conc.pack(side=tk.BOTTOM, anchor="e", pady=2)
+        self._conc_query = None
+        self._conc_offset = 0
         fr = ttk.Frame(right); fr.pack(fill=tk.BOTH, expand=True)
         sb = ttk.Scrollbar(fr); sb.pack(side=tk.RIGHT, fill=tk.Y)
         self.txt_conc = tk.Text(fr, wrap=tk.WORD, state='disabled', yscrollcommand=sb.set)
@@ -79,57 +94,58 @@ class SearchView(ttk.Frame):
         self.main_view.search_debounce_id = self.main_view.root.after(500, self._search)
 
     def _search(self):
-        q = self.entry.get().strip()
-        if not q:
-            return
+        self.start_search()
 
-        search_type = self.type_cmb.get()
-        is_partial = self.partial_match.get()
-
-        where_clauses = []
-        params = []
-
-        if search_type == 'Лемма':
-            if is_partial:
-                where_clauses.append("LOWER(t.lemma) LIKE LOWER(?)")
-                params.append(f"%{q}%")
-            else:
-                where_clauses.append("LOWER(t.lemma) = LOWER(?)")
-                params.append(q)
-        elif search_type == 'Словоформа':
-            if is_partial:
-                where_clauses.append("LOWER(t.token) LIKE LOWER(?)")
-                params.append(f"%{q}%")
-            else:
-                where_clauses.append("LOWER(t.token) = LOWER(?)")
-                params.append(q)
-        else:
-            pos_code = self.search_ctrl._translate_pos_to_code(q)
-            if pos_code:
-                where_clauses.append("t.pos = ?")
-                params.append(pos_code)
-
-        sql = """
-            SELECT DISTINCT
-                t.token,
-                t.lemma,
-                t.pos,
-                d.title,
-                s.sentence_text
-            FROM tokens t
-            JOIN sentences s ON t.sentence_id = s.id
-            JOIN documents d ON s.doc_id = d.id
+    def start_search(self):
         """
-        if where_clauses:
-            sql += " WHERE " + " AND ".join(where_clauses)
-        sql += " ORDER BY d.title, s.id, t.start LIMIT 500"
-
-        with self.search_ctrl.db.lock, self.search_ctrl.db.conn:
-            cur = self.search_ctrl.db.conn.cursor()
-            cur.execute(sql, params)
-            res = cur.fetchall()
-
-        self._update_results(res)  # Теперь метод существует!
+        Новый поиск: первая страница результатов и подсчёт их общего числа
+        выполняются в фоне (main_view.executor), предыдущий поиск прерывается.
+        """
+        q = self.entry.get().strip()
+        filters = self.main_view.active_filters.copy()
+        if not q and not filters:
+            return
+        self._search_params = (self.type_cmb.get(), q, filters, self.partial_match.get())
+        self._search_cursor = None
+        self._page_loading = True
+        self._update_results([])
+        self.lbl_total.set("Поиск…")
+        self._submit_search_page()
+
+        params = self._search_params
+        self.main_view.executor.submit(
+            'count',
+            lambda: self.main_view.count_results(*params),
+            lambda total: self.lbl_total.set(f"Найдено: {total}"),
+            self._show_error
+        )
+
+    def _submit_search_page(self):
+        search_type, q, filters, partial = self._search_params
+        after = self._search_cursor
+        self.main_view.executor.submit(
+            'search',
+            lambda: self.on_search(search_type, q, filters, partial, after),
+            self._on_search_page,
+            self._show_error
+        )
+
+    def _on_search_page(self, page):
+        rows, self._search_cursor = page
+        self._page_loading = False
+        self._update_results(rows, append=True)
+
+    def _show_error(self, error):
+        self._page_loading = False
+        self.lbl_total.set(f"Ошибка запроса: {error}")
+
+    def _on_tree_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        # Прокрутка близко к концу — подгружаем следующую страницу
+        if (self._search_cursor is not None and not self._page_loading
+                and float(last) >= 0.95 and self.tree.winfo_ismapped()):
+            self._page_loading = True
+            self._submit_search_page()
 
     def _on_select(self, _=None):
         sel = self.tree.selection()
@@ -153,18 +169,51 @@ class SearchView(ttk.Frame):
             self.txt_gram.insert(tk.END, f"• {translated_v}\n")
         self.txt_gram.configure(state='disabled')
 
-    def show_concordance(self, lines):
-        self.txt_conc.configure(state='normal'); self.txt_conc.delete(1.0, tk.END)
+    def show_concordance(self, lines, append=False):
+        self.txt_conc.configure(state='normal')
+        if not append: self.txt_conc.delete(1.0, tk.END)
         for l in lines: self.txt_conc.insert(tk.END, l+"\n")
         self.txt_conc.configure(state='disabled')
 
-    def _update_results(self, results):
+    def start_concordance(self, token, left, right):
+        """Показать первую страницу конкорданса словоформы."""
+        self._conc_query = (token, left, right)
+        self._conc_offset = 0
+        self._load_concordance_page(append=False)
+
+    def _more_concordance(self):
+        if self._conc_query:
+            self._load_concordance_page(append=True)
+
+    def _load_concordance_page(self, append):
+        token, left, right = self._conc_query
+        page_size = Config.CONCORDANCE_PAGE_SIZE
+        offset = self._conc_offset
+        self.btn_more_conc.configure(state='disabled')
+
+        def show(lines):
+            self._conc_offset = offset + page_size
+            self.show_concordance(lines, append)
+            # Неполная страница — вхождения закончились
+            self.btn_more_conc.configure(state='normal' if len(lines) >= page_size else 'disabled')
+
+        self.main_view.executor.submit(
+            'concordance',
+            lambda: self.get_concordance(token, left, right, page_size, offset),
+            show,
+            lambda error: self.show_concordance([f"Ошибка запроса: {error}"], append)
+        )
+
+    def _update_results(self, results, append=False):
         """Обновить дерево результатов поиска."""
         # Очистка предыдущих результатов
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        if not append:
+            self.tree.delete(*self.tree.get_children())
         
         # Добавление новых данных
         for row in results:
-            translated_pos = self.search_ctrl.translator.translate_pos(row[2])
+            # у совпадений шаблона части речи элементов через пробел
+            translated_pos = " ".join(
+                self.search_ctrl.translator.translate_pos(pos) for pos in row[2].split(" ")
+            ) if row[2] else row[2]
             self.tree.insert("", "end", values=(row[0], row[1], translated_pos, row[3], row[4]))